@@ -4,24 +4,29 @@
 from .main import app
 from .data_processing import (
     process_review_data,
+    process_review_range,
     query_by_employee_id,
     query_by_name,
     query_by_manuscript_id_or_reviewer
 )
 from .database import load_employee_data
-from .utils import read_excel, is_internal, match_employee_info
+from .utils import read_excel, is_internal, classify_internal, match_employee_info
+from .employee_matcher import EmployeeMatcher
 
 # 定义 __all__ 列表，控制 "from backend import *" 的行为
 __all__ = [
     'app',
     'process_review_data',
+    'process_review_range',
     'query_by_employee_id',
     'query_by_name',
     'query_by_manuscript_id_or_reviewer',
     'load_employee_data',
     'read_excel',
     'is_internal',
-    'match_employee_info'
+    'classify_internal',
+    'match_employee_info',
+    'EmployeeMatcher'
 ]
 
 # 包的元数据
@@ -0,0 +1,214 @@
+import time
+import queue
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+BUSY_TIMEOUT = 30  # 数据库被锁定时的最长等待时间（秒）
+WRITE_BATCH_SIZE = 200  # 单写线程每个事务最多执行的写操作数
+WRITE_FLUSH_INTERVAL = 0.5  # 单写线程等待凑批的最长时间（秒）
+WRITE_FLUSH_TIMEOUT = 300  # 等待单写线程写完队列的最长时间（秒）
+
+# 每个连接的设置；WAL 模式下读写互不阻塞，synchronous=NORMAL 在 WAL 下仍能保证断电后数据库不损坏
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",  # 约 16MB 页缓存
+)
+
+# 数据库结构的迁移，按顺序执行；已执行到第几个保存在 PRAGMA user_version 中。只能在末尾追加，不要修改已有的迁移
+MIGRATIONS = [
+    # 1: 文章表和条件请求用的页面缓存（与旧版 create_table 建的表相同，已有的表保持不变）
+    [
+        '''CREATE TABLE IF NOT EXISTS articles (
+            title TEXT,
+            pdf_link TEXT,
+            local_path TEXT,
+            year TEXT,
+            issue TEXT,
+            article_id TEXT PRIMARY KEY,
+            author_name TEXT,
+            is_internal INTEGER
+        )''',
+        '''CREATE TABLE IF NOT EXISTS page_cache (
+            url TEXT PRIMARY KEY,
+            etag TEXT,
+            last_modified TEXT,
+            body TEXT,
+            fetched_at REAL
+        )''',
+    ],
+    # 2: 按年份和期数查询文章的索引（article_id 是主键，已有唯一索引）
+    [
+        "CREATE INDEX IF NOT EXISTS idx_articles_year_issue ON articles (year, issue)",
+    ],
+]
+
+
+def connect(db_path, timeout=BUSY_TIMEOUT):
+    """打开数据库连接：WAL 模式、按列名取值，被锁定时最多等待 timeout 秒"""
+    conn = sqlite3.connect(db_path, timeout=timeout)
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def migrate(db_path):
+    """把数据库结构升级到最新版本，返回升级前的版本号；多个进程同时调用时只有一个会执行迁移"""
+    conn = connect(db_path)
+    conn.isolation_level = None  # 手动控制事务，保证迁移和版本号一起提交
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        try:
+            for number, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+                for statement in statements:
+                    conn.execute(statement)
+                logger.info(f"数据库 {db_path} 已升级到版本 {number}")
+            if version < len(MIGRATIONS):
+                conn.execute(f"PRAGMA user_version = {len(MIGRATIONS)}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return version
+    finally:
+        conn.close()
+
+
+class ArticleWriter:
+    """
+    单写线程：各线程提交的写操作放入队列，由一个后台线程合并成批，在一个事务中执行，
+    避免多个线程和进程各自频繁提交、争抢数据库锁。写操作按提交顺序执行。
+    on_commit(error) 在所在批次提交后调用，成功时 error 为 None。只在创建它的进程中使用。
+    后台线程无法打开数据库或意外出错时，排队中的写操作以错误回调、flush 立即返回，下次提交时重新启动线程。
+    """
+
+    _STOP = object()
+
+    def __init__(self, db_path, batch_size=WRITE_BATCH_SIZE, flush_interval=WRITE_FLUSH_INTERVAL):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='article-writer', daemon=True)
+                self._thread.start()
+
+    def execute(self, sql, params=(), on_commit=None, require_rows=False):
+        """提交一个写操作，立即返回；require_rows 为 True 时没有影响任何行也视为出错"""
+        self._ensure_started()
+        self._queue.put((sql, params, on_commit, require_rows))
+
+    def flush(self, timeout=None):
+        """等待此前提交的写操作全部写入数据库，超时返回 False"""
+        self._ensure_started()
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        """写完队列中的操作后停止后台线程"""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None and thread.is_alive():
+            self._queue.put(self._STOP)
+            thread.join()
+
+    def _run(self):
+        batch = []
+        try:
+            conn = connect(self.db_path)
+        except Exception as e:
+            logger.error(f"单写线程无法打开数据库 {self.db_path}: {e}")
+            self._fail_pending(batch, str(e))
+            return
+        try:
+            while True:
+                batch = [self._queue.get()]
+                deadline = time.monotonic() + self.flush_interval
+                # 凑批：直到批次已满、超过等待时间，或遇到 flush/停止标记
+                while len(batch) < self.batch_size and isinstance(batch[-1], tuple):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(self._queue.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+                self._write(conn, [item for item in batch if isinstance(item, tuple)])
+                for item in batch:
+                    if isinstance(item, threading.Event):
+                        item.set()
+                if batch[-1] is self._STOP:
+                    return
+                batch = []
+        except Exception as e:
+            logger.error(f"单写线程出错: {e}")
+            self._fail_pending(batch, str(e))
+        finally:
+            conn.close()
+
+    def _fail_pending(self, batch, error):
+        """后台线程退出前：当前批次和队列中的写操作以错误回调，flush 标记全部放行"""
+        with self._lock:
+            if self._thread is threading.current_thread():
+                self._thread = None
+        items = list(batch)
+        while True:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for item in items:
+            if isinstance(item, threading.Event):
+                item.set()
+            elif isinstance(item, tuple):
+                self._callback(item[2], error)
+
+    @staticmethod
+    def _callback(on_commit, error):
+        if on_commit is None:
+            return
+        try:
+            on_commit(error)
+        except Exception as e:
+            logger.error(f"写入回调出错: {e}")
+
+    @staticmethod
+    def _check_rows(cursor, require_rows):
+        if require_rows and cursor.rowcount == 0:
+            return "没有匹配的记录，未更新任何行"
+        return None
+
+    def _write(self, conn, writes):
+        if not writes:
+            return
+        results = []
+        try:
+            with conn:
+                for sql, params, _, require_rows in writes:
+                    results.append(self._check_rows(conn.execute(sql, params), require_rows))
+        except Exception as e:
+            # 整批回滚后逐条重试，一条出错不影响同批的其他写操作
+            logger.error(f"批量写入数据库时出错，逐条重试: {e}")
+            results = []
+            for sql, params, _, require_rows in writes:
+                try:
+                    with conn:
+                        results.append(self._check_rows(conn.execute(sql, params), require_rows))
+                except Exception as e:
+                    logger.error(f"写入数据库时出错: {e}")
+                    results.append(str(e))
+        for (_, _, on_commit, _), error in zip(writes, results):
+            self._callback(on_commit, error)
@@ -4,6 +4,10 @@ from datetime import datetime, timedelta
 from openpyxl import load_workbook
 from openpyxl.styles import PatternFill, Font
 import os
+from employee_matcher import EmployeeMatcher
+from report_writer import ReportWriter
+from fee_engine import reconcile_re_reviews
+from utils import classify_internal
 
 # 添加输出路径定义
 OUTPUT_PATH = os.path.join(os.path.dirname(__file__), 'output')
@@ -81,13 +85,6 @@ def query_by_name(employee_data, name_str):
 
 
 
-def is_internal(unit, address):
-    """
-    判断审稿人是否为校内人员
-    """
-    keywords = ['江南大学', '蠡湖大道', '1800号']
-    return any(keyword in str(unit) or keyword in str(address) for keyword in keywords)
-
 def match_employee_id(name, employee_df):
     """
     匹配员工工号，并检查是否有重复
@@ -116,9 +113,9 @@ def get_target_month():
         except ValueError:
             print("错误：请输入有效的数字")
 
-def process_review_data(review_file, re_review_file, employee_file, retired_file, target_month):
+def process_review_data(review_file, re_review_file, employee_file, retired_file, target_month, fee_rules=None):
     """
-    处理审稿数据的主函数
+    处理审稿数据的主函数，fee_rules 可覆盖 fee_engine.DEFAULT_FEE_RULES 中的费用规则
     """
     # 读取文件
     review_df = read_excel(review_file)
@@ -147,55 +144,16 @@ def process_review_data(review_file, re_review_file, employee_file, retired_file
     review_df = review_df[(review_df['审回时间'] >= start_date) & (review_df['审回时间'] <= end_date)]
     re_review_df = re_review_df[(re_review_df['审回时间'] >= start_date) & (re_review_df['审回时间'] <= next_month_end)]
 
-    # 初始化费用
-    review_df['审稿费用'] = 150
-    review_df['复审'] = False
-    review_df['复审月份'] = ''
-
-    # 处理复审数据
-    for _, row in re_review_df.iterrows():
-        mask = (review_df['稿件编号'] == row['稿件编号'])
-        if mask.any():
-            review_df.loc[mask, '审稿费用'] = review_df.loc[mask, '审稿费用'].apply(lambda x: min(x + 50, 200))
-            review_df.loc[mask, '复审'] = True
-            current_month = row['审回时间'].strftime('%Y-%m')
-            review_df.loc[mask, '复审月份'] += f"{current_month}," if review_df.loc[mask, '复审月份'].values[0] else current_month
-        else:
-            print(f"警告：复审记录无配的评审记录 - 稿件编号: {row['稿件编号']}")
-
-    #复审无匹配统计待增加
-    
+    # 复审费用核算（按稿件编号一次性汇总）
+    review_df, unmatched_df = reconcile_re_reviews(review_df, re_review_df, fee_rules)
+    for manuscript_id in unmatched_df['稿件编号']:
+        print(f"警告：复审记录无匹配的评审记录 - 稿件编号: {manuscript_id}")
 
     # 判断校内/校外
-    review_df['校内人员'] = review_df.apply(lambda row: is_internal(row['审稿人单位'], row['审稿人地址']), axis=1)
-
-    # 工号匹配
-    def match_employee_info(name, employee_df, retired_df):
-        matches = employee_df[employee_df['姓名'] == name]
-        if len(matches) == 0:
-            # 在退休人员中查找
-            retired_matches = retired_df[retired_df['姓名'] == name]
-            if len(retired_matches) == 0:
-                return None, None, False, 'not_found'
-            elif len(retired_matches) == 1:
-                return retired_matches.iloc[0]['工号'], retired_matches.iloc[0]['部门'], False, 'retired'
-            else:
-                return retired_matches.iloc[0]['工号'], retired_matches.iloc[0]['部门'], True, 'retired'
-        elif len(matches) == 1:
-            return matches.iloc[0]['工号'], matches.iloc[0]['部门'], False, 'active'
-        else:
-            return matches.iloc[0]['工号'], matches.iloc[0]['部门'], True, 'active'
-
-    review_df['工号'] = ''
-    review_df['部门'] = ''
-    review_df['工号重复'] = False
-    review_df['人员状态'] = ''
-    for idx, row in review_df[review_df['校内人员']].iterrows():
-        emp_id, department, is_duplicate, status = match_employee_info(row['审稿人姓名'], employee_df, retired_df)
-        review_df.at[idx, '工号'] = emp_id if emp_id else ''
-        review_df.at[idx, '部门'] = department if department else ''
-        review_df.at[idx, '工号重复'] = is_duplicate
-        review_df.at[idx, '人员状态'] = status
+    review_df['校内人员'] = classify_internal(review_df)
+
+    # 工号匹配（批量匹配校内人员）
+    EmployeeMatcher(employee_df, retired_df).assign(review_df, review_df['校内人员'])
 
     print("审稿数据列名:", review_df.columns.tolist())  # 保留这行来帮助调试
 
@@ -235,108 +193,54 @@ def save_to_excel(data, target_month):
     """保存数据到Excel文件并在数据下方添加统计报表"""
     output_file = os.path.join(OUTPUT_PATH, f'review_fee_{target_month}.xlsx')
     
-    # 创建DataFrame并保存到Excel
+    # 创建DataFrame
     df = pd.DataFrame(data)
     
-    # 创建ExcelWriter对象
-    with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
-        # 写入主数据
-        df.to_excel(writer, index=False, sheet_name='Sheet1')
-        
-        # 获取工作簿和工作表对象
-        workbook = writer.book
-        worksheet = writer.sheets['Sheet1']
-        
-        # 获取数据最后一行的位置
-        last_row = len(df) + 2  # 加2是因为标题行和从1开始计数
-        
-        # 在数据下方添加统计报表
-        add_detailed_statistics(worksheet, df)
+    # 流式写出主数据，再在数据下方添加统计报表
+    with ReportWriter(output_file) as writer:
+        writer.write_dataframe(df)
+        writer.blank_rows(1)
+        add_detailed_statistics(writer, df)
     
     return output_file
 
-def add_detailed_statistics(worksheet, df):
+def add_detailed_statistics(writer, df):
     """生成简化版审稿费统计报表"""
-    bold_font = Font(bold=True)
-    last_row = worksheet.max_row + 2
-
     # 添加标题
-    worksheet.cell(row=last_row, column=1, value="评审专家统计").font = bold_font
-    last_row += 1
+    writer.append_styled(["评审专家统计"], bold=True)
 
     # 校内在职专家统计
-    worksheet.cell(row=last_row, column=1, value="校内在职专家").font = bold_font
-    worksheet.cell(row=last_row, column=2, value="工号").font = bold_font
-    worksheet.cell(row=last_row, column=3, value="金额").font = bold_font
-    last_row += 1
-
     internal_active = df[(df['校内人员']) & (df['人员状态'] == 'active')]
     internal_active_grouped = internal_active.groupby(['审稿人姓名', '工号'])['审稿费金额'].sum().reset_index()
     internal_active_grouped = internal_active_grouped.sort_values('审稿费金额', ascending=False)
-
-    for _, row in internal_active_grouped.iterrows():
-        worksheet.cell(row=last_row, column=1, value=row['审稿人姓名'])
-        worksheet.cell(row=last_row, column=2, value=row['工号'])
-        worksheet.cell(row=last_row, column=3, value=row['审稿费金额'])
-        last_row += 1
-
-    # 校内在职总金额
-    worksheet.cell(row=last_row, column=1, value="校内在职总金额").font = bold_font
-    worksheet.cell(row=last_row, column=3, value=internal_active_grouped['审稿费金额'].sum()).font = bold_font
-    last_row += 2
+    writer.write_summary_block(
+        ["校内在职专家", "工号", "金额"],
+        internal_active_grouped[['审稿人姓名', '工号', '审稿费金额']].itertuples(index=False, name=None),
+        "校内在职总金额", internal_active_grouped['审稿费金额'].sum()
+    )
 
     # 校内退休专家统计
-    worksheet.cell(row=last_row, column=1, value="校内退休专家").font = bold_font
-    worksheet.cell(row=last_row, column=2, value="工号").font = bold_font
-    worksheet.cell(row=last_row, column=3, value="金额").font = bold_font
-    last_row += 1
-
     internal_retired = df[(df['校内人员']) & (df['人员状态'] == 'retired')]
     internal_retired_grouped = internal_retired.groupby(['审稿人姓名', '工号'])['审稿费金额'].sum().reset_index()
     internal_retired_grouped = internal_retired_grouped.sort_values('审稿费金额', ascending=False)
-
-    for _, row in internal_retired_grouped.iterrows():
-        worksheet.cell(row=last_row, column=1, value=row['审稿人姓名'])
-        worksheet.cell(row=last_row, column=2, value=row['工号'])
-        worksheet.cell(row=last_row, column=3, value=row['审稿费金额'])
-        last_row += 1
-
-    # 校内退休总金额
-    worksheet.cell(row=last_row, column=1, value="校内退休总金额").font = bold_font
-    worksheet.cell(row=last_row, column=3, value=internal_retired_grouped['审稿费金额'].sum()).font = bold_font
-    last_row += 2
+    writer.write_summary_block(
+        ["校内退休专家", "工号", "金额"],
+        internal_retired_grouped[['审稿人姓名', '工号', '审稿费金额']].itertuples(index=False, name=None),
+        "校内退休总金额", internal_retired_grouped['审稿费金额'].sum()
+    )
 
     # 校外专家统计
-    worksheet.cell(row=last_row, column=1, value="校外专家").font = bold_font
-    worksheet.cell(row=last_row, column=2, value="身份证号").font = bold_font
-    worksheet.cell(row=last_row, column=3, value="金额").font = bold_font
-    last_row += 1
-
     external = df[~df['校内人员']]
     external_grouped = external.groupby(['审稿人姓名', '审稿人身份证号'])['审稿费金额'].sum().reset_index()
     external_grouped = external_grouped.sort_values('审稿费金额', ascending=False)
-
-    for _, row in external_grouped.iterrows():
-        worksheet.cell(row=last_row, column=1, value=row['审稿人姓名'])
-        worksheet.cell(row=last_row, column=2, value=row['审稿人身份证号'] if pd.notna(row['审稿人身份证号']) else '')
-        worksheet.cell(row=last_row, column=3, value=row['审稿费金额'])
-        last_row += 1
-
-    # 校外总金额
-    worksheet.cell(row=last_row, column=1, value="校外总金额").font = bold_font
-    worksheet.cell(row=last_row, column=3, value=external_grouped['审稿费金额'].sum()).font = bold_font
-    last_row += 2
+    writer.write_summary_block(
+        ["校外专家", "身份证号", "金额"],
+        external_grouped[['审稿人姓名', '审稿人身份证号', '审稿费金额']].itertuples(index=False, name=None),
+        "校外总金额", external_grouped['审稿费金额'].sum()
+    )
 
     # 总计
-    worksheet.cell(row=last_row, column=1, value="总计").font = bold_font
-    total = df['审稿费金额'].sum()
-    worksheet.cell(row=last_row, column=3, value=total).font = bold_font
-
-    # 设置金额列的数字格式
-    for row in range(worksheet.max_row - worksheet.min_row + 1):
-        cell = worksheet.cell(row=row + 1, column=3)
-        if isinstance(cell.value, (int, float)):
-            cell.number_format = '#,##0.00'
+    writer.append_styled(["总计", None, df['审稿费金额'].sum()], bold=True, amount_columns=(2,))
 
 def query_by_manuscript_id_or_reviewer(review_file, re_review_file, query):
     review_df = read_excel(review_file)
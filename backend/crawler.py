@@ -0,0 +1,360 @@
+import json
+import time
+import logging
+import argparse
+import threading
+from multiprocessing import Process, Queue as MPQueue
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from webpq import (
+    DB_NAME, FETCH_WORKERS, RENDER_WORKERS, RENDER_DPI, RENDER_FORMAT,
+    create_table, get_years_and_issues, parse_issue_page, fetch_article, save_article,
+    load_known_articles, process_pdf, collect_render_results, article_writer
+)
+from article_db import connect, WRITE_FLUSH_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# 工作队列中任务的状态
+TASK_PENDING = 'pending'
+TASK_RUNNING = 'running'
+TASK_DOWNLOADED = 'downloaded'  # 文章已下载入库，等待转换首页
+TASK_DONE = 'done'
+TASK_FAILED = 'failed'
+
+MAX_ATTEMPTS = 3  # 每个任务最多尝试次数
+
+
+class CrawlQueue:
+    """
+    爬取工作队列，保存在爬虫数据库的 crawl_queue 表中。
+    任务分两类：issue（获取期数页面，展开为文章任务）和 article（获取详情、下载PDF、转换首页）。
+    每个任务记录状态和尝试次数；进程中断后 running 的任务重新变为 pending，下次从中断处继续。
+    """
+
+    def __init__(self, db_path=DB_NAME, max_attempts=MAX_ATTEMPTS):
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        self._create_table()
+
+    def _connect(self):
+        return connect(self.db_path)
+
+    def _create_table(self):
+        conn = self._connect()
+        try:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS crawl_queue (
+                    task_key TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    year TEXT NOT NULL,
+                    issue TEXT NOT NULL,
+                    article_id TEXT,
+                    title TEXT,
+                    pdf_link TEXT,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    updated_at REAL
+                );
+                CREATE INDEX IF NOT EXISTS idx_crawl_queue_kind_status ON crawl_queue (kind, status);
+            ''')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def recover(self):
+        """把上次中断时仍在运行的任务放回队列，返回任务数"""
+        conn = self._connect()
+        try:
+            count = conn.execute("UPDATE crawl_queue SET status = ? WHERE status = ?",
+                                 (TASK_PENDING, TASK_RUNNING)).rowcount
+            conn.commit()
+            return count
+        finally:
+            conn.close()
+
+    def add_issues(self, years_issues, refresh=False):
+        """加入期数任务；refresh 为 True 时已完成的期数也重新获取（用于发现新发表的文章）"""
+        rows = [(f"issue:{year}:{issue}", 'issue', year, issue, TASK_PENDING, time.time())
+                for year, issues in years_issues.items() for issue in issues]
+        conn = self._connect()
+        try:
+            conn.executemany("""
+                INSERT OR IGNORE INTO crawl_queue (task_key, kind, year, issue, status, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, rows)
+            if refresh:
+                conn.executemany("UPDATE crawl_queue SET status = ?, attempts = 0 WHERE task_key = ? AND status = ?",
+                                 [(TASK_PENDING, row[0], TASK_DONE) for row in rows])
+            conn.commit()
+        finally:
+            conn.close()
+
+    def add_articles(self, year, issue, entries):
+        """加入文章任务，已存在的文章任务保持原状态"""
+        conn = self._connect()
+        try:
+            conn.executemany("""
+                INSERT OR IGNORE INTO crawl_queue (task_key, kind, year, issue, article_id, title, pdf_link, status, updated_at)
+                VALUES (?, 'article', ?, ?, ?, ?, ?, ?, ?)
+            """, [(f"article:{article_id}", year, issue, article_id, title, pdf_link, TASK_PENDING, time.time())
+                  for title, pdf_link, article_id in entries])
+            conn.commit()
+        finally:
+            conn.close()
+
+    def claim(self, kind, limit):
+        """取出至多 limit 个待处理任务并标记为运行中，尝试次数加一"""
+        if limit <= 0:
+            return []
+        conn = self._connect()
+        try:
+            rows = conn.execute("""
+                SELECT * FROM crawl_queue WHERE kind = ? AND status = ? ORDER BY rowid LIMIT ?
+            """, (kind, TASK_PENDING, limit)).fetchall()
+            conn.executemany("UPDATE crawl_queue SET status = ?, attempts = attempts + 1, updated_at = ? WHERE task_key = ?",
+                             [(TASK_RUNNING, time.time(), row['task_key']) for row in rows])
+            conn.commit()
+            return [dict(row) for row in rows]
+        finally:
+            conn.close()
+
+    def tasks(self, kind, status):
+        conn = self._connect()
+        try:
+            return [dict(row) for row in conn.execute(
+                "SELECT * FROM crawl_queue WHERE kind = ? AND status = ? ORDER BY rowid", (kind, status))]
+        finally:
+            conn.close()
+
+    def mark(self, task_key, status, error=None):
+        conn = self._connect()
+        try:
+            conn.execute("UPDATE crawl_queue SET status = ?, last_error = ?, updated_at = ? WHERE task_key = ?",
+                         (status, error, time.time(), task_key))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def fail(self, task_key, error):
+        """任务失败：尝试次数未用完时放回队列，否则标记为 failed"""
+        conn = self._connect()
+        try:
+            conn.execute("""
+                UPDATE crawl_queue SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END,
+                                       last_error = ?, updated_at = ?
+                WHERE task_key = ?
+            """, (self.max_attempts, TASK_FAILED, TASK_PENDING, error, time.time(), task_key))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def has_pending(self):
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT 1 FROM crawl_queue WHERE status = ? LIMIT 1", (TASK_PENDING,)).fetchone() is not None
+        finally:
+            conn.close()
+
+    def summary(self):
+        """各类任务按状态计数：{kind: {status: 数量}}"""
+        conn = self._connect()
+        try:
+            result = {}
+            for row in conn.execute("SELECT kind, status, COUNT(*) AS count FROM crawl_queue GROUP BY kind, status"):
+                result.setdefault(row['kind'], {})[row['status']] = row['count']
+            return result
+        finally:
+            conn.close()
+
+
+def crawl(years=None, workers=FETCH_WORKERS, render_workers=RENDER_WORKERS, dpi=RENDER_DPI, fmt=RENDER_FORMAT,
+          incremental=True, refresh=False, max_attempts=MAX_ATTEMPTS):
+    """
+    爬取 years 中（默认全部年份）所有期数的文章：期数和文章都作为任务写入工作队列，
+    由 workers 个线程并发获取，render_workers 个进程转换首页。中断后再次调用会从中断处继续。
+    返回工作队列的统计。
+    """
+    create_table()
+    queue = CrawlQueue(max_attempts=max_attempts)
+    recovered = queue.recover()
+    if recovered:
+        logger.info(f"恢复上次中断的 {recovered} 个任务")
+
+    years_issues = get_years_and_issues(years)
+    queue.add_issues(years_issues, refresh=refresh)
+
+    pdf_queue = MPQueue()
+    result_queue = MPQueue()
+
+    def start_renderer():
+        process = Process(target=process_pdf, args=(pdf_queue, None, None, result_queue, dpi, fmt))
+        process.start()
+        return process
+
+    render_processes = [start_renderer() for _ in range(max(1, render_workers))]
+
+    saving = set()      # 已获取、文章记录尚未提交的文章任务
+    rendering = set()   # 已放入转换队列、尚未完成的文章任务
+    rendering_lock = threading.Lock()
+
+    def enqueue_render(task_key, article_info, year, issue):
+        with rendering_lock:
+            rendering.add(task_key)
+        pdf_queue.put((article_info['local_path'], article_info['is_internal'],
+                       article_info['article_id'], article_info['title'], (year, issue)))
+
+    def on_render(article_id, stage, error=None):
+        task_key = f"article:{article_id}"
+        if stage == 'rendered':
+            queue.mark(task_key, TASK_DONE)
+        else:
+            queue.fail(task_key, error)
+        with rendering_lock:
+            rendering.discard(task_key)
+
+    def start_collector():
+        thread = threading.Thread(target=collect_render_results,
+                                  args=(result_queue, render_processes, on_render), daemon=True)
+        thread.start()
+        return thread
+
+    def check_renderers():
+        """
+        处理进程异常退出（pdf2image 崩溃、内存不足等）时无法确定它正在转换哪篇文章，
+        把所有等待转换的文章放回队列重新处理，并补充新的处理进程；结果收集线程已退出时重新启动。
+        """
+        nonlocal collector
+        dead = [index for index, process in enumerate(render_processes) if not process.is_alive()]
+        if dead:
+            logger.error(f"{len(dead)} 个处理进程异常退出，等待转换的文章将重新处理")
+            with rendering_lock:
+                lost = list(rendering)
+                rendering.clear()
+            for task_key in lost:
+                queue.fail(task_key, "处理进程异常退出")
+            # 原位替换，结果收集线程使用同一个列表判断进程是否都已结束
+            for index in dead:
+                render_processes[index] = start_renderer()
+        if not collector.is_alive():
+            collector = start_collector()
+
+    collector = start_collector()
+
+    def resume_known(tasks):
+        """已有完整记录的文章不再获取：图片已存在的直接完成，PDF已下载的只重新转换"""
+        by_id = {task['article_id']: task for task in tasks}
+        known = load_known_articles(list(by_id)) if incremental else {}
+        for article_id, article_info in known.items():
+            task = by_id[article_id]
+            if article_info['local_path'].lower().endswith('.pdf'):
+                queue.mark(task['task_key'], TASK_DOWNLOADED)
+                enqueue_render(task['task_key'], article_info, task['year'], task['issue'])
+            else:
+                queue.mark(task['task_key'], TASK_DONE)
+        return known
+
+    # 上次下载完成但未转换的文章；记录或PDF已不在时重新获取
+    downloaded = queue.tasks('article', TASK_DOWNLOADED)
+    known = resume_known(downloaded)
+    for task in downloaded:
+        if task['article_id'] not in known:
+            queue.mark(task['task_key'], TASK_PENDING)
+
+    def run_issue(task):
+        entries = parse_issue_page(task['year'], task['issue'], conditional=incremental)
+        if entries is None:
+            raise RuntimeError("无法获取期数页面")
+        return entries
+
+    def run_article(task):
+        article_info = fetch_article((task['title'], task['pdf_link'], task['article_id']), conditional=incremental)
+        if article_info is None:
+            raise RuntimeError("无法获取文章详情或下载PDF")
+        return article_info
+
+    def on_saved(task, article_info, error):
+        # 文章记录提交后才放入转换队列：转换结果的更新一定能找到记录，处理进程异常退出时的失败标记也不会被覆盖
+        if error is None:
+            queue.mark(task['task_key'], TASK_DOWNLOADED)
+            enqueue_render(task['task_key'], article_info, task['year'], task['issue'])
+        else:
+            queue.fail(task['task_key'], error)
+        with rendering_lock:
+            saving.discard(task['task_key'])
+
+    try:
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                check_renderers()
+                # 先展开期数，再处理文章；保持线程池中有足够的任务
+                capacity = workers * 2 - len(in_flight)
+                for task in queue.claim('issue', capacity):
+                    in_flight[executor.submit(run_issue, task)] = task
+                capacity = workers * 2 - len(in_flight)
+                for task in queue.claim('article', capacity):
+                    in_flight[executor.submit(run_article, task)] = task
+
+                if not in_flight:
+                    with rendering_lock:
+                        waiting = bool(saving or rendering)
+                    # 转换失败的文章会放回队列，等转换全部完成后再检查一次
+                    if waiting or queue.has_pending():
+                        time.sleep(0.5)
+                        continue
+                    break
+
+                done, _ = wait(in_flight, timeout=1, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = in_flight.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logger.error(f"任务失败: {task['task_key']}, 错误: {e}")
+                        queue.fail(task['task_key'], str(e))
+                        continue
+
+                    if task['kind'] == 'issue':
+                        queue.add_articles(task['year'], task['issue'], result)
+                        queue.mark(task['task_key'], TASK_DONE)
+                        new_tasks = [t for t in queue.tasks('article', TASK_PENDING)
+                                     if t['year'] == task['year'] and t['issue'] == task['issue']]
+                        resume_known(new_tasks)
+                        logger.info(f"{task['year']} 年 {task['issue']}: 共 {len(result)} 篇文章")
+                    else:
+                        # 文章记录由单写线程批量写入，提交后才标记为已下载并开始转换
+                        with rendering_lock:
+                            saving.add(task['task_key'])
+                        save_article(result, task['year'], task['issue'],
+                                     on_commit=lambda error, task=task, result=result: on_saved(task, result, error))
+    finally:
+        for _ in render_processes:
+            pdf_queue.put(None)
+        collector.join()
+        for process in render_processes:
+            process.join()
+        if not article_writer.flush(timeout=WRITE_FLUSH_TIMEOUT):
+            logger.error(f"等待数据库写入超时（{WRITE_FLUSH_TIMEOUT} 秒），部分文章的状态可能尚未更新")
+
+    summary = queue.summary()
+    logger.info(f"爬取完成: {summary}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="爬取多个年份全部期数的文章，中断后再次运行从中断处继续")
+    parser.add_argument('--years', nargs='*', help="只爬取这些年份（默认全部年份）")
+    parser.add_argument('--workers', type=int, default=FETCH_WORKERS, help="并发获取的线程数")
+    parser.add_argument('--render-workers', type=int, default=RENDER_WORKERS, help="转换首页的进程数")
+    parser.add_argument('--full', action='store_true', help="忽略已有记录和页面缓存，全部重新获取")
+    parser.add_argument('--refresh', action='store_true', help="重新获取已完成的期数页面，发现新发表的文章")
+    args = parser.parse_args()
+
+    summary = crawl(years=args.years, workers=args.workers, render_workers=args.render_workers,
+                    incremental=not args.full, refresh=args.refresh)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
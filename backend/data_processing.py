@@ -1,66 +1,84 @@
+import os
+import multiprocessing
 import pandas as pd
-from datetime import datetime, timedelta
-from utils import read_excel, is_internal, match_employee_info
-
-def process_review_data(review_file, re_review_file, employee_file, retired_file, target_month):
+from concurrent.futures import ProcessPoolExecutor
+from utils import classify_internal
+from excel_cache import read_excel_cached, cached_derivation
+from employee_matcher import get_employee_matcher
+from review_index import get_review_index
+from report_writer import write_dataframe_to_excel
+
+class ReviewSources:
     """
-    处理审稿数据的主函数 - 修改版
+    合并后的评审/复审数据，按审回月份稳定排序，并附带月份分区索引。
+    同一月份内保持 评审在前、复审在后 以及源表中的原始顺序；取某个月的数据只是一次切片。
     """
-    # 读取所有文件
-    review_df = read_excel(review_file)
-    re_review_df = read_excel(re_review_file)
-    employee_df = read_excel(employee_file)
-    retired_df = read_excel(retired_file)
 
-    if review_df is None or re_review_df is None or employee_df is None or retired_df is None:
-        print("错误：一个或多个必要的文件无法读取。请检查文件路径和格式。")
-        return None
+    def __init__(self, combined_df):
+        month_key = combined_df['审回时间'].dt.to_period('M')
+        order = month_key.sort_values(kind='stable', na_position='last').index
+        self.data = combined_df.loc[order].reset_index(drop=True)
+        months = month_key.loc[order].reset_index(drop=True)
 
-    # 转换日期列并格式化为年月日
-    review_df['审回时间'] = pd.to_datetime(review_df['审回时间']).dt.strftime('%Y-%m-%d')
-    re_review_df['审回时间'] = pd.to_datetime(re_review_df['审回时间']).dt.strftime('%Y-%m-%d')
+        # 月份 -> (起始行, 结束行)
+        self.partitions = {}
+        valid = months.notna()
+        if valid.any():
+            codes = months[valid].dt.strftime('%Y-%m')
+            bounds = codes.ne(codes.shift()).to_numpy().nonzero()[0].tolist() + [len(codes)]
+            for begin, end in zip(bounds[:-1], bounds[1:]):
+                self.partitions[codes.iloc[begin]] = (begin, end)
 
-    # 筛选目标月份数据
-    target_date = datetime.strptime(target_month, "%Y-%m")
-    start_date = target_date.replace(day=1)
-    end_date = (start_date + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    def month(self, month):
+        begin, end = self.partitions.get(month, (0, 0))
+        return self.data.iloc[begin:end]
 
-    # 筛选月份（需要重新转换日期进行比较）
-    review_df['比较日期'] = pd.to_datetime(review_df['审回时间'])
-    re_review_df['比较日期'] = pd.to_datetime(re_review_df['审回时间'])
-    
-    review_df = review_df[(review_df['比较日期'] >= start_date) & (review_df['比较日期'] <= end_date)]
-    re_review_df = re_review_df[(re_review_df['比较日期'] >= start_date) & (re_review_df['比较日期'] <= end_date)]
-    
-    # 删除比较日期列
-    review_df = review_df.drop('比较日期', axis=1)
-    re_review_df = re_review_df.drop('比较日期', axis=1)
+    def months(self):
+        return sorted(self.partitions)
+
+
+def _prepare_review_sources(review_file, re_review_file):
+    review_df = read_excel_cached(review_file)
+    re_review_df = read_excel_cached(re_review_file)
+    if review_df is None or re_review_df is None:
+        return None
+
+    # 日期只解析一次，去掉时分秒，与按日筛选的口径一致；字符串格式化只在输出时进行
+    review_df['审回时间'] = pd.to_datetime(review_df['审回时间']).dt.normalize()
+    re_review_df['审回时间'] = pd.to_datetime(re_review_df['审回时间']).dt.normalize()
 
     # 添加数据来源标记
     review_df['审稿类型'] = '评审'
     re_review_df['审稿类型'] = '复审'
 
     # 合并评审和复审数据
-    combined_df = pd.concat([review_df, re_review_df], ignore_index=True)
+    return ReviewSources(pd.concat([review_df, re_review_df], ignore_index=True))
+
+def load_review_sources(review_file, re_review_file):
+    """
+    读取并预处理评审表和复审表，返回 ReviewSources。
+    结果随源表版本缓存在磁盘和内存中，任一文件无法读取时返回 None。
+    """
+    return cached_derivation('review_sources', [review_file, re_review_file],
+                             lambda: _prepare_review_sources(review_file, re_review_file))
 
+def build_month_data(month_df, matcher):
+    """
+    对某个月的合并数据做费用筛选、校内外判断、工号匹配和列整理，返回 DataFrame
+    """
     # 剔除审稿费金额为空或 0 的数据
-    combined_df = combined_df[combined_df['审稿费金额'].notna() & (combined_df['审稿费金额'] != 0)]
+    combined_df = month_df[month_df['审稿费金额'].notna() & (month_df['审稿费金额'] != 0)].copy()
+    if combined_df.empty:
+        return combined_df
+
+    # 输出时才格式化日期
+    combined_df['审回时间'] = combined_df['审回时间'].dt.strftime('%Y-%m-%d')
 
     # 判断校内/校外
-    combined_df['校内人员'] = combined_df.apply(lambda row: is_internal(row['审稿人单位'], row['审稿人地址']), axis=1)
+    combined_df['校内人员'] = classify_internal(combined_df)
 
-    # 工号匹配
-    combined_df['工号'] = ''
-    combined_df['部门'] = ''
-    combined_df['工号重复'] = False
-    combined_df['人员状态'] = ''
-    
-    for idx, row in combined_df[combined_df['校内人员']].iterrows():
-        emp_id, department, is_duplicate, status = match_employee_info(row['审稿人姓名'], employee_df, retired_df)
-        combined_df.at[idx, '工号'] = emp_id if emp_id else ''
-        combined_df.at[idx, '部门'] = department if department else ''
-        combined_df.at[idx, '工号重复'] = is_duplicate
-        combined_df.at[idx, '人员状态'] = status
+    # 工号匹配（只匹配校内人员）
+    matcher.assign(combined_df, combined_df['校内人员'])
 
     # 只检查校外专家的银行账户信息
     combined_df['银行账户缺失'] = ''
@@ -90,10 +108,73 @@ def process_review_data(review_file, re_review_file, employee_file, retired_file
     remaining_columns = [col for col in combined_df.columns if col not in existing_columns]
     final_columns = existing_columns + remaining_columns
 
-    combined_df = combined_df[final_columns]
+    return combined_df[final_columns]
+
+def to_records(df):
+    """将 NaN 值替换为 None 后转换为字典列表"""
+    return df.where(pd.notnull(df), None).to_dict(orient='records')
+
+def normalize_month(month):
+    """把 2024-3、2024/03、202403 等写法统一为分区使用的 YYYY-MM；无法解析时抛出 ValueError"""
+    return pd.Period(str(month).strip(), 'M').strftime('%Y-%m')
+
+def process_review_data(review_file, re_review_file, employee_file, retired_file, target_month):
+    """
+    处理审稿数据的主函数 - 修改版
+    """
+    # 读取所有文件（评审/复审表走磁盘缓存）
+    sources = load_review_sources(review_file, re_review_file)
+    matcher = get_employee_matcher(employee_file, retired_file)
+
+    if sources is None or matcher is None:
+        print("错误：一个或多个必要的文件无法读取。请检查文件路径和格式。")
+        return None
+
+    # 目标月份数据直接按分区索引切片
+    return to_records(build_month_data(sources.month(normalize_month(target_month)), matcher))
+
+def _write_month_report(month, month_df, matcher, output_path):
+    """子进程中处理单个月份并写出 Excel，返回清单条目"""
+    result_df = build_month_data(month_df, matcher)
+    if result_df.empty:
+        return {"month": month, "file": None, "rows": 0}
+    output_file = os.path.join(output_path, f'审稿费用统计_{month}.xlsx')
+    write_dataframe_to_excel(output_file, result_df)
+    return {"month": month, "file": output_file, "rows": len(result_df)}
+
+def process_review_range(review_file, re_review_file, employee_file, retired_file,
+                         start_month, end_month, output_path, max_workers=None):
+    """
+    多月份处理：源表只读取一次，按月份分区索引切片后在多个子进程中生成各月的
+    审稿费用统计_YYYY-MM.xlsx，返回按月份排序的文件清单。
+    """
+    months = pd.period_range(start=start_month, end=end_month, freq='M').strftime('%Y-%m').tolist()
+    if not months:
+        raise ValueError(f"无效的月份范围: {start_month} 至 {end_month}")
+
+    sources = load_review_sources(review_file, re_review_file)
+    matcher = get_employee_matcher(employee_file, retired_file)
+    if sources is None or matcher is None:
+        print("错误：一个或多个必要的文件无法读取。请检查文件路径和格式。")
+        return None
 
-    # 在返回数据之前，将 NaN 值替换为 None
-    return combined_df.where(pd.notnull(combined_df), None).to_dict(orient='records')
+    os.makedirs(output_path, exist_ok=True)
+    partitions = {month: sources.month(month) for month in months if month in sources.partitions}
+    manifest = {month: {"month": month, "file": None, "rows": 0} for month in months}
+
+    max_workers = min(max_workers or os.cpu_count() or 1, len(partitions)) if partitions else 1
+    if max_workers <= 1:
+        for month, month_df in partitions.items():
+            manifest[month] = _write_month_report(month, month_df, matcher, output_path)
+    else:
+        # 在 Flask 请求中调用时进程里已有后台线程和持有的锁，fork 出的子进程可能死锁，统一用 spawn 启动
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = [executor.submit(_write_month_report, month, month_df, matcher, output_path)
+                       for month, month_df in partitions.items()]
+            for future in futures:
+                entry = future.result()
+                manifest[entry["month"]] = entry
+    return [manifest[month] for month in months]
 
 def query_by_employee_id(employee_data, employee_id):
     try:
@@ -122,22 +203,5 @@ def query_by_name(employee_data, name):
         return {"message": f"未找到姓名为 {name} 的员工"}
     return results
 
-def query_by_manuscript_id_or_reviewer(review_file, re_review_file, query):
-    review_df = read_excel(review_file)
-    re_review_df = read_excel(re_review_file)
-
-    if review_df is None or re_review_df is None:
-        return {"error": "无法读取评审表或复审表文件"}
-
-    review_df['稿件编号'] = review_df['稿件编号'].astype(str)
-    re_review_df['稿件编号'] = re_review_df['稿件编号'].astype(str)
-
-    review_result = review_df[(review_df['稿件编号'] == query) | (review_df['审稿人姓名'] == query)]
-    re_review_result = re_review_df[(re_review_df['稿件编号'] == query) | (re_review_df['审稿人姓名'] == query)]
-
-    results = {
-        "review": review_result[['稿件编号', '审稿人姓名', '审回时间']].to_dict(orient='records'),
-        "re_review": re_review_result[['稿件编号', '审稿人姓名', '审回时间']].to_dict(orient='records')
-    }
-
-    return results
+def query_by_manuscript_id_or_reviewer(review_file, re_review_file, query, mode='auto'):
+    return get_review_index(review_file, re_review_file).search(query, mode)
@@ -0,0 +1,179 @@
+import os
+import time
+import logging
+import threading
+import pandas as pd
+from database import load_employee_data
+
+RESULT_COLUMNS = ['姓名', '工号', '部门']
+BATCH_STATUS_FOUND = '找到'
+BATCH_STATUS_AMBIGUOUS = '重名'
+BATCH_STATUS_MISSING = '未找到'
+
+
+class _Snapshot:
+    """某一时刻员工数据的只读快照，带按工号和姓名的哈希索引"""
+
+    def __init__(self, employee_data, version):
+        self.version = version
+        if employee_data is None or len(employee_data) == 0:
+            self.data = None
+            self.records = []
+            self.by_id = {}
+            self.by_name = {}
+            return
+        data = employee_data.reset_index(drop=True)
+        self.data = data
+        self.records = data[RESULT_COLUMNS].to_dict(orient='records')
+        self.by_id = {int(k): v for k, v in data.groupby('工号').indices.items()}
+        self.by_name = dict(data.groupby('姓名').indices)
+
+    def lookup(self, index, key):
+        return [self.records[i] for i in index.get(key, ())]
+
+
+class EmployeeDirectory:
+    """
+    常驻内存的职工目录。
+    在职/退休员工表变化时重新构建快照并整体替换，查询时按工号或姓名 O(1) 命中。
+    """
+
+    def __init__(self, employee_file, retired_file, check_interval=5):
+        self.employee_file = employee_file
+        self.retired_file = retired_file
+        self.check_interval = check_interval
+        self._snapshot = _Snapshot(None, None)
+        self._last_check = 0
+        self._lock = threading.Lock()
+        self._watcher = None
+        self._stop = threading.Event()
+        self.reload()
+
+    def _version(self):
+        try:
+            return tuple((os.stat(path).st_mtime, os.stat(path).st_size)
+                         for path in (self.employee_file, self.retired_file))
+        except OSError:
+            return None
+
+    def reload(self, force=True):
+        """重新加载员工数据，文件未变化且 force 为 False 时跳过"""
+        with self._lock:
+            version = self._version()
+            self._last_check = time.monotonic()
+            if not force and version == self._snapshot.version:
+                return False
+            if version is None:
+                logging.error(f"员工数据文件不存在: {self.employee_file}, {self.retired_file}")
+                return False
+            logging.info("开始加载员工数据...")
+            employee_data = load_employee_data(self.employee_file, self.retired_file)
+            if employee_data is None:
+                # 保留旧快照，避免文件正在写入时查询全部失败
+                logging.error("员工数据加载失败，继续使用旧数据")
+                return False
+            self._snapshot = _Snapshot(employee_data, version)
+            logging.info(f"员工数据加载成功，共 {len(employee_data)} 条记录")
+            return True
+
+    def snapshot(self):
+        """返回当前快照；未启动后台监视时按 check_interval 检查文件是否变化"""
+        if self._watcher is None and time.monotonic() - self._last_check >= self.check_interval:
+            self.reload(force=False)
+        return self._snapshot
+
+    @property
+    def data(self):
+        return self.snapshot().data
+
+    def start_watching(self, interval=None):
+        """启动后台线程定时检查员工表，变化时在后台重建快照"""
+        if self._watcher is not None:
+            return
+        interval = interval or self.check_interval
+
+        def watch():
+            while not self._stop.wait(interval):
+                try:
+                    self.reload(force=False)
+                except Exception as e:
+                    logging.error(f"重新加载员工数据时发生错误: {str(e)}")
+
+        self._watcher = threading.Thread(target=watch, name='employee-directory-watcher', daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        if self._watcher is not None:
+            self._stop.set()
+            self._watcher.join()
+            self._watcher = None
+            self._stop.clear()
+
+    def query_by_employee_id(self, employee_id):
+        """按工号查询，多个工号以空白分隔；返回值格式与 data_processing.query_by_employee_id 相同"""
+        try:
+            employee_ids = [int(id.strip()) for id in str(employee_id).split()]
+        except ValueError as e:
+            return {"message": f"无效的工号格式: {str(e)}"}
+        snapshot = self.snapshot()
+        results = []
+        for emp_id in employee_ids:
+            results.extend(snapshot.lookup(snapshot.by_id, emp_id))
+        if not results:
+            return {"message": f"未找到工号为 {employee_id} 的员工"}
+        return results
+
+    def query_by_name(self, name):
+        """按姓名查询，多个姓名以空白分隔；返回值格式与 data_processing.query_by_name 相同"""
+        snapshot = self.snapshot()
+        results = []
+        for n in name.split():
+            results.extend(snapshot.lookup(snapshot.by_name, n.strip()))
+        if not results:
+            return {"message": f"未找到姓名为 {name} 的员工"}
+        return results
+
+    def batch_table(self, keys, by='工号'):
+        """
+        批量查询，一次 isin + merge 完成。
+        返回按输入顺序排列的 DataFrame：查询值、姓名、工号、部门、状态（找到/重名/未找到）。
+        """
+        keys = pd.Series(list(keys), dtype=object).astype(str).str.strip()
+        keys = pd.Series(pd.unique(keys[keys != '']), dtype=object)
+        if by == '工号':
+            coerced = pd.to_numeric(keys, errors='coerce')
+            # 带小数（如 12.5）或超出整数范围的工号无法转为整数，按未找到处理
+            lookup_keys = coerced.where((coerced % 1 == 0) & (coerced.abs() < 2 ** 53)).astype('Int64')
+        else:
+            lookup_keys = keys
+        query = pd.DataFrame({'查询值': keys, by: lookup_keys})
+
+        data = self.snapshot().data
+        if data is None:
+            data = pd.DataFrame(columns=RESULT_COLUMNS)
+        matched = data.loc[data[by].isin(lookup_keys.dropna()), RESULT_COLUMNS].astype({'工号': 'Int64'})
+        table = query.merge(matched, on=by, how='left', sort=False, indicator=True)
+
+        counts = table.groupby('查询值', sort=False)['查询值'].transform('size')
+        table['状态'] = BATCH_STATUS_FOUND
+        table.loc[counts > 1, '状态'] = BATCH_STATUS_AMBIGUOUS
+        missing = table['_merge'] == 'left_only'
+        table.loc[missing, '状态'] = BATCH_STATUS_MISSING
+        table.loc[missing, RESULT_COLUMNS] = pd.NA
+        return table[['查询值'] + RESULT_COLUMNS + ['状态']]
+
+    def batch_query(self, keys, by='工号'):
+        """批量查询并按 found / ambiguous / missing 分组"""
+        table = self.batch_table(keys, by)
+        table = table.astype(object).where(table.notna(), None)
+        found = table[table['状态'] == BATCH_STATUS_FOUND]
+        ambiguous = table[table['状态'] == BATCH_STATUS_AMBIGUOUS]
+        missing = table[table['状态'] == BATCH_STATUS_MISSING]
+        return {
+            "found": found[RESULT_COLUMNS].to_dict(orient='records'),
+            "ambiguous": [
+                {"key": key, "matches": group[RESULT_COLUMNS].to_dict(orient='records')}
+                for key, group in ambiguous.groupby('查询值', sort=False)
+            ],
+            "missing": missing['查询值'].tolist()
+        }
@@ -0,0 +1,85 @@
+import os
+import threading
+import pandas as pd
+from excel_cache import read_excel_cached
+
+MATCH_COLUMNS = ['工号', '部门', '工号重复', '人员状态']
+
+
+class EmployeeMatcher:
+    """
+    按姓名批量匹配工号/部门的查找表，每份员工快照只构建一次。
+    规则与 utils.match_employee_info 一致：在职优先于退休，同名取第一条并标记工号重复。
+    """
+
+    def __init__(self, employee_df, retired_df):
+        active = self._build(employee_df, 'active')
+        retired = self._build(retired_df, 'retired')
+        # 在职记录排在前面，去重后同名人员只保留在职信息
+        lookup = pd.concat([active, retired])
+        self.lookup = lookup[~lookup.index.duplicated(keep='first')]
+
+    @staticmethod
+    def _build(df, status):
+        # 姓名为空的员工记录不参与匹配，否则空的审稿人姓名会匹配到这些记录
+        df = df[df['姓名'].notna() & (df['姓名'].astype(str).str.strip() != '')]
+        counts = df['姓名'].value_counts()
+        first = df.drop_duplicates('姓名', keep='first').set_index('姓名')[['工号', '部门']].astype(object)
+        first['工号重复'] = counts.reindex(first.index).values > 1
+        first['人员状态'] = status
+        return first
+
+    def match(self, names):
+        """
+        批量匹配姓名，返回与 names 等长、索引一致的 DataFrame（列：工号/部门/工号重复/人员状态）。
+        未找到的姓名（包括空姓名）工号和部门为空字符串，人员状态为 not_found。
+        """
+        names = pd.Series(names)
+        result = self.lookup.reindex(names.values)
+        result.index = names.index
+        found = result['人员状态'].notna()
+        result['工号'] = result['工号'].where(found, '')
+        result['部门'] = result['部门'].where(found, '')
+        result['工号重复'] = result['工号重复'].where(found, False).astype(bool)
+        result['人员状态'] = result['人员状态'].where(found, 'not_found')
+        return result
+
+    def assign(self, df, mask, name_column='审稿人姓名'):
+        """在 df 上添加匹配列，只对 mask 为 True 的行进行匹配，其余行保持空值"""
+        df['工号'] = ''
+        df['部门'] = ''
+        df['工号重复'] = False
+        df['人员状态'] = ''
+        matched = self.match(df.loc[mask, name_column])
+        if not matched.empty:
+            for column in MATCH_COLUMNS:
+                df.loc[mask, column] = matched[column].values
+        return df
+
+
+_matchers = {}
+_lock = threading.Lock()
+
+
+def get_employee_matcher(employee_file, retired_file):
+    """按两个员工表的修改时间和大小缓存匹配器，员工表未变化时直接复用；读取失败返回 None"""
+    try:
+        key = tuple((path, os.stat(path).st_mtime, os.stat(path).st_size)
+                    for path in (employee_file, retired_file))
+    except OSError as e:
+        print(f"读取员工数据文件时出错: {e}")
+        return None
+
+    with _lock:
+        cached = _matchers.get((employee_file, retired_file))
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+    employee_df = read_excel_cached(employee_file)
+    retired_df = read_excel_cached(retired_file)
+    if employee_df is None or retired_df is None:
+        return None
+    matcher = EmployeeMatcher(employee_df, retired_df)
+    with _lock:
+        _matchers[(employee_file, retired_file)] = (key, matcher)
+    return matcher
@@ -0,0 +1,163 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+import pandas as pd
+from utils import read_excel
+
+# 缓存目录：每个源表对应一个 .pkl 数据文件和一个 .json 元数据文件
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache')
+
+_memory_cache = {}
+_lock = threading.Lock()
+
+
+def _file_digest(path, chunk_size=1024 * 1024):
+    """计算文件内容的 SHA1"""
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def _cache_paths(path):
+    key = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()[:16]
+    base = os.path.join(CACHE_DIR, f"{os.path.splitext(os.path.basename(path))[0]}_{key}")
+    return base + '.pkl', base + '.json'
+
+
+def _load_meta(meta_path):
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(meta_path, meta):
+    tmp_path = meta_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp_path, meta_path)
+
+
+def _rebuild(path, data_path, meta_path, meta):
+    """用 read_excel 解析源表并写入缓存文件"""
+    df = read_excel(path)
+    if df is None:
+        return None
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = data_path + '.tmp'
+    df.to_pickle(tmp_path)
+    os.replace(tmp_path, data_path)
+    _write_meta(meta_path, meta)
+    logging.info(f"已重建表格缓存: {path}")
+    return df
+
+
+def read_excel_cached(path):
+    """
+    读取 Excel 文件，结果按 路径 + 修改时间 + 内容哈希 缓存到磁盘。
+    源文件未变化时直接加载缓存，跳过 xlrd/openpyxl 解析；读取失败时返回 None。
+    """
+    try:
+        stat = os.stat(path)
+    except OSError as e:
+        print(f"读取文件 {path} 时出错: {e}")
+        return None
+
+    data_path, meta_path = _cache_paths(path)
+    meta = _load_meta(meta_path)
+    fresh = (meta is not None and os.path.exists(data_path)
+             and meta.get('mtime') == stat.st_mtime and meta.get('size') == stat.st_size)
+
+    with _lock:
+        if fresh:
+            cached = _memory_cache.get(path)
+            if cached is not None and cached[0] == meta['sha1']:
+                return cached[1].copy()
+
+        if not fresh:
+            # 修改时间变化但内容可能未变（如同步盘重新写入），按内容哈希确认
+            digest = _file_digest(path)
+            new_meta = {'source': os.path.abspath(path), 'mtime': stat.st_mtime,
+                        'size': stat.st_size, 'sha1': digest}
+            if meta is not None and meta.get('sha1') == digest and os.path.exists(data_path):
+                _write_meta(meta_path, new_meta)
+                meta = new_meta
+            else:
+                df = _rebuild(path, data_path, meta_path, new_meta)
+                if df is None:
+                    return None
+                _memory_cache[path] = (digest, df)
+                return df.copy()
+
+        try:
+            df = pd.read_pickle(data_path)
+        except Exception as e:
+            logging.warning(f"缓存文件损坏，重新解析: {data_path}, 错误: {e}")
+            df = _rebuild(path, data_path, meta_path, meta)
+            if df is None:
+                return None
+        _memory_cache[path] = (meta['sha1'], df)
+        return df.copy()
+
+
+def clear_cache(path=None):
+    """删除指定源表（或全部）的缓存"""
+    with _lock:
+        if path is None:
+            _memory_cache.clear()
+            if os.path.isdir(CACHE_DIR):
+                for name in os.listdir(CACHE_DIR):
+                    os.remove(os.path.join(CACHE_DIR, name))
+            return
+        _memory_cache.pop(path, None)
+        for cache_path in _cache_paths(path):
+            if os.path.exists(cache_path):
+                os.remove(cache_path)
+
+
+def _source_version(paths):
+    return tuple((os.path.abspath(path), os.stat(path).st_mtime, os.stat(path).st_size) for path in paths)
+
+
+def cached_derivation(name, paths, build):
+    """
+    缓存由若干源文件派生出的数据（如预处理后的表格和索引），保存在缓存目录中。
+    任一源文件的修改时间或大小变化时调用 build() 重新生成；build 返回 None 时不缓存。
+    """
+    try:
+        version = _source_version(paths)
+    except OSError as e:
+        print(f"读取文件时出错: {e}")
+        return None
+
+    key = hashlib.sha1('|'.join(os.path.abspath(path) for path in paths).encode('utf-8')).hexdigest()[:16]
+    cache_path = os.path.join(CACHE_DIR, f"{name}_{key}.pkl")
+    memory_key = (name, key)
+
+    with _lock:
+        cached = _memory_cache.get(memory_key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        try:
+            payload = pd.read_pickle(cache_path)
+            if payload.get('version') == version:
+                _memory_cache[memory_key] = (version, payload['value'])
+                return payload['value']
+        except Exception:
+            pass
+
+    value = build()
+    if value is None:
+        return None
+    with _lock:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = cache_path + '.tmp'
+        pd.to_pickle({'version': version, 'value': value}, tmp_path)
+        os.replace(tmp_path, cache_path)
+        _memory_cache[memory_key] = (version, value)
+    return value
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+
+# 审稿费规则：评审基础费用，每次复审增加的费用，单篇稿件费用上限
+DEFAULT_FEE_RULES = {
+    'base': 150,
+    'increment': 50,
+    'cap': 200,
+}
+
+
+def reconcile_re_reviews(review_df, re_review_df, rules=None):
+    """
+    将复审记录按稿件编号一次性汇总并合并到评审记录上。
+    返回 (review_df, unmatched_df)：
+      review_df 增加 审稿费用/复审/复审月份 三列，费用 = min(基础费用 + 复审次数 × 增量, 上限)；
+      unmatched_df 为找不到对应评审记录的复审记录。
+    不限定月份，可直接用于全年数据。
+    """
+    rules = {**DEFAULT_FEE_RULES, **(rules or {})}
+    review_df = review_df.copy()
+    review_ids = review_df['稿件编号'].astype(str)
+    re_review_ids = re_review_df['稿件编号'].astype(str)
+
+    # 每篇稿件的复审次数和复审月份（按复审表中的顺序，以逗号分隔）
+    months = pd.to_datetime(re_review_df['审回时间']).dt.strftime('%Y-%m')
+    grouped = pd.DataFrame({'稿件编号': re_review_ids.values, '复审月份': months.fillna('').values})
+    summary = grouped.groupby('稿件编号', sort=False).agg(
+        复审次数=('复审月份', 'size'),
+        复审月份=('复审月份', ','.join),
+    )
+
+    counts = review_ids.map(summary['复审次数']).fillna(0).astype(int)
+    fees = np.minimum(rules['base'] + rules['increment'] * counts, max(rules['cap'], rules['base']))
+    review_df['审稿费用'] = fees
+    review_df['复审'] = counts > 0
+    review_df['复审月份'] = review_ids.map(summary['复审月份']).fillna('')
+
+    unmatched_df = re_review_df[~re_review_ids.isin(set(review_ids))]
+    return review_df, unmatched_df
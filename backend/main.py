@@ -1,17 +1,24 @@
-from flask import Flask, request, jsonify, send_from_directory
-from data_processing import process_review_data, query_by_employee_id, query_by_name, query_by_manuscript_id_or_reviewer
-from database import load_employee_data
+from flask import Flask, request, jsonify, send_from_directory, send_file, Response
+from data_processing import process_review_data, process_review_range, query_by_manuscript_id_or_reviewer, normalize_month
+from employee_directory import EmployeeDirectory
+from report_writer import write_records_to_excel
+from review_index import SEARCH_MODES
+from page_fee import create_page_fee_model, STATUS_TYPES, PAGE_FEE_FILTERS
+from page_fee_store import PageFeeStore, WorkbookChangedError, create_page_fee_store
 import os
 import pandas as pd
 import numpy as np
 from openpyxl import load_workbook
-from openpyxl.styles import PatternFill, Font
 import logging
 from openpyxl.utils import get_column_letter
-from webpq import scrape_and_process_data
+from scrape_jobs import ScrapeJobRunner, JobNotCancellableError, FINISHED_STATES
+import io
+import re
+import hashlib
 import json
 import subprocess
 import platform
+import threading
 from spark_chat_interactive import SparkChatBot
 
 logging.basicConfig(
@@ -35,25 +42,8 @@ re_review_file = os.path.join(base_path, '复审.xls')
 employee_file = os.path.join(base_path, '在职员工.xlsx')
 retired_file = os.path.join(base_path, '退休员工.xlsx')
 
-# 添加文件路径检查
-for file_path in [review_file, re_review_file, employee_file, retired_file]:
-    if os.path.exists(file_path):
-        logging.info(f"文件存在: {file_path}")
-    else:
-        logging.error(f"文件不存在: {file_path}")
-
-# 修改加载员工数据部分
-try:
-    logging.info("开始加载员工数据...")
-    employee_data = load_employee_data(employee_file, retired_file)
-    logging.info("员工数据加载成功")
-except FileNotFoundError as e:
-    logging.error(f"文件未找到: {str(e)}")
-    # 可以选择设置一个默认值或者抛出异常
-    employee_data = []
-except Exception as e:
-    logging.error(f"加载员工数据时发生未知错误: {str(e)}")
-    raise
+# 常驻内存的职工目录，员工表变化时后台自动重新加载（在 start_services 中创建）
+employee_directory = None
 
 import numpy as np
 
@@ -63,27 +53,38 @@ OUTPUT_PATH = '/Users/changfusheng/Desktop/学报/PY_AUTO/output'
 # 设置版面费Excel文件路径
 PAGE_FEE_FILE = '/Users/changfusheng/Library/CloudStorage/OneDrive-个人/文档/2024下.xlsx'
 
+# 版面费存储方式：'xlsx' 常驻内存并批量写回 Excel；'sqlite' 使用 SQLite 镜像并定时导出为 Excel
+PAGE_FEE_BACKEND = 'xlsx'
+PAGE_FEE_DB = os.path.join(base_path, 'page_fee.db')
+PAGE_FEE_EXPORT_INTERVAL = 300  # 秒
+
+page_fee_model = None  # 在 start_services 中创建
+
 # 设置记事本数据文件路径
 NOTES_FILE = '/Users/changfusheng/Desktop/学报/PY_AUTO/data/notes.json'
 
-spark_chatbot = SparkChatBot()
+spark_chatbot = None  # 在 start_services 中创建
 
 @app.route('/process_review', methods=['POST'])
 def process_review():
+    start_month = request.json.get('start_month')
+    end_month = request.json.get('end_month')
+    if start_month or end_month:
+        return process_review_range_request(start_month, end_month)
+
     target_month = request.json.get('target_month')
     if not target_month:
         return jsonify({"error": "缺少 target_month 参数"}), 400
+    try:
+        target_month = normalize_month(target_month)
+    except ValueError:
+        return jsonify({"error": f"无效的月份: {target_month}，应为 YYYY-MM 格式"}), 400
     try:
         result = process_review_data(review_file, re_review_file, employee_file, retired_file, target_month)
         if isinstance(result, list) and result:
-            # 将结果保存为 Excel 文件
-            df = pd.DataFrame(result)
+            # 将结果流式写出为 Excel 文件（写出器会确保输出目录存在）
             output_file = os.path.join(OUTPUT_PATH, f'审稿费用统计_{target_month}.xlsx')
-            
-            # 确保输出目录存在
-            os.makedirs(os.path.dirname(output_file), exist_ok=True)
-            
-            df.to_excel(output_file, index=False)
+            write_records_to_excel(output_file, result)
             return jsonify({"message": "数据处理成功", "file": output_file}), 200
         else:
             return jsonify({"error": "没有找到符合条件的数据"}), 404
@@ -91,6 +92,22 @@ def process_review():
         print(f"处理过程中发生错误: {str(e)}")  # 打印错误信息
         return jsonify({"error": f"处理失败：{str(e)}"}), 400
 
+def process_review_range_request(start_month, end_month):
+    """多月份模式：一次读取源表，按月份并行生成统计文件并返回清单"""
+    if not start_month or not end_month:
+        return jsonify({"error": "缺少 start_month 或 end_month 参数"}), 400
+    try:
+        manifest = process_review_range(review_file, re_review_file, employee_file, retired_file,
+                                        start_month, end_month, OUTPUT_PATH)
+        if manifest is None:
+            return jsonify({"error": "一个或多个必要的文件无法读取"}), 400
+        if not any(entry["file"] for entry in manifest):
+            return jsonify({"error": "没有找到符合条件的数据"}), 404
+        return jsonify({"message": "数据处理成功", "files": manifest}), 200
+    except Exception as e:
+        print(f"处理过程中发生错误: {str(e)}")
+        return jsonify({"error": f"处理失败：{str(e)}"}), 400
+
 @app.route('/query_employee', methods=['GET'])
 def query_employee():
     employee_id = request.args.get('employee_id')
@@ -98,9 +115,9 @@ def query_employee():
     
     try:
         if employee_id:
-            result = query_by_employee_id(employee_data, employee_id)
+            result = employee_directory.query_by_employee_id(employee_id)
         elif name:
-            result = query_by_name(employee_data, name)
+            result = employee_directory.query_by_name(name)
         else:
             return jsonify({"error": "请提供员工ID或姓名"}), 400
         
@@ -118,10 +135,55 @@ def query_employee():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# 批量查询时 CSV 分块输出的行数
+BATCH_CSV_CHUNK_SIZE = 5000
+
+@app.route('/query_employee/batch', methods=['POST'])
+def query_employee_batch():
+    data = request.json or {}
+    if data.get('employee_ids'):
+        keys, by = data['employee_ids'], '工号'
+    elif data.get('names'):
+        keys, by = data['names'], '姓名'
+    else:
+        return jsonify({"error": "请提供 employee_ids 或 names"}), 400
+
+    # 支持直接粘贴整列文本
+    if isinstance(keys, str):
+        keys = re.split(r'[\s,，、]+', keys)
+    output_format = data.get('format', 'json')
+
+    try:
+        if output_format == 'json':
+            return jsonify({"type": "employee_batch", "data": employee_directory.batch_query(keys, by)})
+
+        table = employee_directory.batch_table(keys, by)
+        if output_format == 'csv':
+            def generate():
+                yield '\ufeff' + table.iloc[:0].to_csv(index=False)
+                for start in range(0, len(table), BATCH_CSV_CHUNK_SIZE):
+                    yield table.iloc[start:start + BATCH_CSV_CHUNK_SIZE].to_csv(index=False, header=False)
+
+            return Response(generate(), mimetype='text/csv',
+                            headers={'Content-Disposition': 'attachment; filename=employee_batch.csv'})
+        elif output_format == 'xlsx':
+            buffer = io.BytesIO()
+            table.to_excel(buffer, index=False)
+            buffer.seek(0)
+            return send_file(buffer, as_attachment=True, download_name='employee_batch.xlsx',
+                             mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        else:
+            return jsonify({"error": f"不支持的输出格式: {output_format}"}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/query_manuscript', methods=['GET'])
 def query_manuscript():
     query = request.args.get('query')
-    result = query_by_manuscript_id_or_reviewer(review_file, re_review_file, query)
+    mode = request.args.get('mode', 'auto')
+    if mode not in SEARCH_MODES:
+        return jsonify({"error": f"无效的检索方式: {mode}，应为 {'/'.join(SEARCH_MODES)} 之一"}), 400
+    result = query_by_manuscript_id_or_reviewer(review_file, re_review_file, query, mode)
     
     # 格式化结果
     formatted_result = {
@@ -137,32 +199,31 @@ from openpyxl.utils import get_column_letter
 @app.route('/get_page_fee_data', methods=['GET'])
 def get_page_fee_data():
     try:
+        filter_name = request.args.get('filter', 'all')
+        search = request.args.get('q')
+        order = request.args.get('order', 'desc')
+        offset = request.args.get('offset', 0, type=int)
+        limit = request.args.get('limit', type=int)
+        if filter_name not in PAGE_FEE_FILTERS or order not in ('asc', 'desc') or offset < 0 or (limit is not None and limit < 0):
+            return jsonify({'error': '无效的查询参数'}), 400
+
+        # 数据和查询参数都未变化时返回 304
+        etag = hashlib.sha1(f"{page_fee_model.etag()}|{request.query_string.decode()}".encode('utf-8')).hexdigest()
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+
         logging.debug(f"尝试读取件: {PAGE_FEE_FILE}")
-        wb = load_workbook(PAGE_FEE_FILE)
-        ws = wb.active
-
-        data = []
-        for row in ws.iter_rows(min_row=2, values_only=True):
-            if row[1]:  # 确保稿件编号不为空
-                status_value = row[10] if len(row) > 10 else ''
-                statuses = set(status_value.split(', ')) if status_value and status_value != "已完成" else {'录用', '发票'}
-
-                row_data = {
-                    '备注': row[0] or '',
-                    '稿件编号': str(row[1]),  # 直接返回完整的稿件编号
-                    '核销号': row[2] or '',
-                    '财务备注': row[5] or '' if len(row) > 5 else '',
-                    '税号': row[6] or '' if len(row) > 6 else '',
-                    '发票抬头': row[4] or '' if len(row) > 4 else '',
-                    '邮箱': row[7] or '' if len(row) > 7 else '',
-                    '录用': '录用' in statuses,
-                    '发票': '发票' in statuses
-                }
-                data.append(row_data)
-
-        data.reverse()
+        # 先取修改日志版本再读数据，客户端从该版本开始增量同步时不会漏掉修改
+        change_version = page_fee_model.change_version()
+        total, data = page_fee_model.query(filter_name, search, order, offset, limit)
         logging.debug(f"读取到 {len(data)} 条数据")
-        return jsonify(data)
+        response = jsonify(data)
+        response.set_etag(etag)
+        response.headers['X-Total-Count'] = str(total)
+        response.headers['X-Change-Version'] = str(change_version)
+        return response
     except Exception as e:
         logging.error(f"读取文件时发生错误: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -175,30 +236,12 @@ def update_status():
         status_type = data.get('statusType')
         is_checked = data.get('isChecked')
 
-        if not manuscript_number or status_type not in ['录用', '发票']:
+        if not manuscript_number or status_type not in STATUS_TYPES:
             return jsonify({'error': '无效的请求数据'}), 400
 
-        wb = load_workbook(PAGE_FEE_FILE)
-        ws = wb.active
-
-        for row in ws.iter_rows(min_row=2, max_row=ws.max_row):
-            if row[1].value == manuscript_number:  # B列是稿件编号
-                status_cell = row[10]  # K列是状态列
-                current_status = status_cell.value or ''
-                statuses = set(current_status.split(', ')) if current_status else set()
-
-                if is_checked:
-                    statuses.add(status_type)
-                else:
-                    statuses.discard(status_type)
-
-                if '录用' in statuses and '发票' in statuses:
-                    status_cell.value = "已完成"
-                else:
-                    status_cell.value = ', '.join(sorted(statuses))
-                break
-
-        wb.save(PAGE_FEE_FILE)
+        # 修改先写入内存，稍后批量写回 Excel
+        if not page_fee_model.update_status(manuscript_number, status_type, is_checked):
+            return jsonify({'error': f'未找到稿件编号: {manuscript_number}'}), 404
         return jsonify({"message": "状态更新成功"}), 200
     except Exception as e:
         logging.error(f"更新状态时发生错误: {str(e)}")
@@ -208,36 +251,98 @@ def update_status():
 def save_page_fee_data():
     try:
         updated_data = request.json
-        
-        # 读取Excel文件
-        wb = load_workbook(PAGE_FEE_FILE)
-        ws = wb.active
-        
-        # 更新Excel数据
-        for item in updated_data:
-            for row in ws.iter_rows(min_row=2):
-                if row[1].value == item['稿件编号']:
-                    row[0].value = item['备注']
-                    row[2].value = item['核销号']
-                    row[5].value = item['财务备注']
-                    row[6].value = item['税号']
-                    row[4].value = item['发票抬头']
-                    row[7].value = item['邮箱']
-                    
-                    # 设置重复稿件的样式
-                    if item.get('是否重复'):
-                        for cell in row:
-                            cell.fill = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
-                            cell.font = Font(color="9C0006")
-                    break
-        
-        # 保存更新后的Excel文件
-        wb.save(PAGE_FEE_FILE)
-        
-        return jsonify({'message': '数据保存成功'})
+
+        # 一次遍历应用全部修改，然后立即写回 Excel
+        updated, not_found = page_fee_model.bulk_update(updated_data)
+        page_fee_model.flush()
+
+        return jsonify({'message': '数据保存成功', 'updated': len(updated), 'not_found': not_found})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/page_fee/import', methods=['POST'])
+def import_page_fee_data():
+    if not isinstance(page_fee_model, PageFeeStore):
+        return jsonify({'error': '当前版面费存储方式不是 SQLite'}), 400
+    try:
+        count = page_fee_model.import_workbook(PAGE_FEE_FILE)
+        return jsonify({'message': '导入成功', 'count': count})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/page_fee/export', methods=['POST'])
+def export_page_fee_data():
+    if not isinstance(page_fee_model, PageFeeStore):
+        return jsonify({'error': '当前版面费存储方式不是 SQLite'}), 400
+    try:
+        output_file = page_fee_model.export_workbook()
+        return jsonify({'message': '导出成功', 'file': output_file})
+    except WorkbookChangedError as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/page_fee_changes', methods=['GET'])
+def get_page_fee_changes():
+    """返回 since 版本之后修改过的版面费记录；reset 为 true 时客户端需要重新加载全部数据"""
+    since = request.args.get('since', type=int)
+    if since is None:
+        return jsonify({'error': '缺少 since 参数'}), 400
+    try:
+        return jsonify(page_fee_model.changes(since))
     except Exception as e:
+        logging.error(f"读取版面费修改记录时发生错误: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+PAGE_FEE_STREAM_TIMEOUT = 15  # SSE 心跳间隔（秒）
+PAGE_FEE_STREAM_MAX_KEEPALIVES = 8  # 连续心跳多少次后关闭连接，由浏览器自动重连
+
+@app.route('/page_fee_changes/stream', methods=['GET'])
+def stream_page_fee_changes():
+    """
+    以 SSE 推送版面费修改，事件 id 为版本号，断线重连时从 Last-Event-ID 继续。
+    一段时间没有修改时主动关闭连接，客户端已断开的连接不会一直占用服务线程。
+    """
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', type=int)
+    if since is None:
+        return jsonify({'error': '缺少 since 参数'}), 400
+
+    def generate(since):
+        keepalives = 0
+        while keepalives < PAGE_FEE_STREAM_MAX_KEEPALIVES:
+            page_fee_model.wait_for_changes(since, timeout=PAGE_FEE_STREAM_TIMEOUT)
+            # 超时后也检查一次，文件被外部修改时不会触发通知
+            changes = page_fee_model.changes(since)
+            if changes['version'] == since:
+                keepalives += 1
+                yield ': keepalive\n\n'
+                continue
+            keepalives = 0
+            since = changes['version']
+            yield f"id: {since}\nevent: changes\ndata: {json.dumps(changes, ensure_ascii=False)}\n\n"
+
+    return Response(generate(since), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# 爬虫任务在后台线程中执行，状态保存在爬虫数据库中（在 start_services 中创建）
+scrape_jobs = None
+
+TRUE_VALUES = ('true', '1', 'yes')
+FALSE_VALUES = ('false', '0', 'no')
+
+def parse_bool(value):
+    """解析请求中的布尔参数：接受 JSON 布尔值、0/1 以及 true/false、yes/no 字符串，其他值抛出 ValueError"""
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise ValueError(f"无效的布尔值: {value}")
+
 @app.route('/start_scraping', methods=['POST'])
 def start_scraping():
     year = request.json.get('year')
@@ -245,12 +350,56 @@ def start_scraping():
     if not year or not issue:
         return jsonify({"error": "缺少年份或期数"}), 400
     
+    # 默认增量爬取：跳过已有的文章和未变化的页面
+    try:
+        incremental = parse_bool(request.json.get('incremental', True))
+    except ValueError:
+        return jsonify({"error": "incremental 参数应为 true 或 false"}), 400
     try:
-        # 直接调用 scrape_and_process_data 函数
-        result = scrape_and_process_data(year, issue)
-        return jsonify({"message": "爬虫任务完成", "result": result}), 200
+        job_id = scrape_jobs.submit(year, issue, incremental=incremental)
+        return jsonify({"message": "爬虫任务已提交", "job_id": job_id}), 202
     except Exception as e:
-        return jsonify({"error": f"爬虫任务失败: {str(e)}"}), 500
+        return jsonify({"error": f"提交爬虫任务失败: {str(e)}"}), 500
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = scrape_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": f"未找到任务: {job_id}"}), 404
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    try:
+        job = scrape_jobs.cancel(job_id)
+    except JobNotCancellableError as e:
+        return jsonify({"error": str(e)}), 409
+    if job is None:
+        return jsonify({"error": f"未找到任务: {job_id}"}), 404
+    return jsonify(job)
+
+JOB_STREAM_TIMEOUT = 15  # SSE 心跳间隔（秒）
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def stream_job(job_id):
+    """以 SSE 推送任务进度，任务结束后发送最后一次状态并关闭"""
+    if scrape_jobs.get(job_id, include_articles=False) is None:
+        return jsonify({"error": f"未找到任务: {job_id}"}), 404
+
+    def generate():
+        version = None
+        while True:
+            job = scrape_jobs.get(job_id)
+            if job['version'] != version:
+                version = job['version']
+                yield f"event: progress\ndata: {json.dumps(job, ensure_ascii=False)}\n\n"
+            if job['status'] in FINISHED_STATES:
+                return
+            if not scrape_jobs.wait(job_id, version, timeout=JOB_STREAM_TIMEOUT):
+                yield ': keepalive\n\n'
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/<path:filename>')
 def serve_static(filename):
@@ -323,5 +472,55 @@ def open_program_folder():
     except Exception as e:
         return jsonify({"error": f"无法打开程序文件夹: {str(e)}"}), 500
 
+_services_started = False
+_services_lock = threading.Lock()
+
+@app.before_request
+def ensure_services():
+    # 无论由 python main.py、flask run 还是 WSGI 服务器启动，第一个请求到来前都会加载服务
+    start_services()
+
+def start_services():
+    """
+    加载数据并启动后台线程，多次调用只执行一次。只在提供服务的进程中调用（直接运行时启动即调用，
+    其他方式在第一个请求前调用）：导入本模块不加载任何服务，spawn 方式启动的子进程
+    和调试模式下负责重载的父进程都不会处理请求，因此不会加载。
+    """
+    global _services_started
+    if _services_started:
+        return
+    with _services_lock:
+        if _services_started:
+            return
+        _start_services()
+        _services_started = True
+
+def _start_services():
+    global employee_directory, page_fee_model, spark_chatbot, scrape_jobs
+
+    # 添加文件路径检查
+    for file_path in [review_file, re_review_file, employee_file, retired_file]:
+        if os.path.exists(file_path):
+            logging.info(f"文件存在: {file_path}")
+        else:
+            logging.error(f"文件不存在: {file_path}")
+
+    employee_directory = EmployeeDirectory(employee_file, retired_file)
+    employee_directory.start_watching()
+
+    if PAGE_FEE_BACKEND == 'sqlite':
+        page_fee_model = create_page_fee_store(PAGE_FEE_DB, PAGE_FEE_FILE, PAGE_FEE_EXPORT_INTERVAL)
+    else:
+        page_fee_model = create_page_fee_model(PAGE_FEE_FILE)
+
+    spark_chatbot = SparkChatBot()
+
+    scrape_jobs = ScrapeJobRunner()
+    scrape_jobs.start()
+
 if __name__ == '__main__':
-    app.run(debug=True, port=5005)
+    debug = True
+    # 调试模式下 Werkzeug 的父进程只负责监视代码变化并重启子进程，子进程才提供服务
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_services()
+    app.run(debug=debug, port=5005)
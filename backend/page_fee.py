@@ -0,0 +1,482 @@
+import os
+import time
+import atexit
+import logging
+import queue
+import threading
+from collections import deque
+from openpyxl import load_workbook
+from openpyxl.styles import PatternFill, Font
+from utils import file_lock, atomic_save_workbook
+
+# 版面费表的列位置（从 0 开始，对应 A–K 列）
+COL_REMARK = 0          # A 备注
+COL_ID = 1              # B 稿件编号
+COL_VERIFY_NO = 2       # C 核销号
+COL_INVOICE_TITLE = 4   # E 发票抬头
+COL_FINANCE_REMARK = 5  # F 财务备注
+COL_TAX_NO = 6          # G 税号
+COL_EMAIL = 7           # H 邮箱
+COL_STATUS = 10         # K 状态
+COLUMN_COUNT = 11
+
+# 页面可编辑字段 -> 列位置
+EDITABLE_FIELDS = {
+    '备注': COL_REMARK,
+    '核销号': COL_VERIFY_NO,
+    '财务备注': COL_FINANCE_REMARK,
+    '税号': COL_TAX_NO,
+    '发票抬头': COL_INVOICE_TITLE,
+    '邮箱': COL_EMAIL,
+}
+
+# 重复稿件整行标红
+DUPLICATE_FILL = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
+DUPLICATE_FONT = Font(color="9C0006")
+
+# 写回失败后的重试间隔从 flush_delay 开始逐次翻倍，最长不超过该值（秒）
+FLUSH_RETRY_MAX_DELAY = 60
+
+STATUS_TYPES = ('录用', '发票')
+STATUS_DONE = '已完成'
+
+
+def parse_statuses(status_value):
+    """状态列 -> 已勾选的状态集合（空值和“已完成”都视为全部勾选，与页面显示一致）"""
+    if status_value and status_value != STATUS_DONE:
+        return set(status_value.split(', '))
+    return set(STATUS_TYPES)
+
+
+def apply_status_change(current_status, status_type, is_checked):
+    """根据勾选操作计算新的状态列值"""
+    statuses = set(current_status.split(', ')) if current_status else set()
+    if is_checked:
+        statuses.add(status_type)
+    else:
+        statuses.discard(status_type)
+    if '录用' in statuses and '发票' in statuses:
+        return STATUS_DONE
+    return ', '.join(sorted(statuses))
+
+
+def to_ui_record(values):
+    """一行单元格值 -> 页面使用的字典"""
+    statuses = parse_statuses(values[COL_STATUS])
+    return {
+        '备注': values[COL_REMARK] or '',
+        '稿件编号': str(values[COL_ID]),
+        '核销号': values[COL_VERIFY_NO] or '',
+        '财务备注': values[COL_FINANCE_REMARK] or '',
+        '税号': values[COL_TAX_NO] or '',
+        '发票抬头': values[COL_INVOICE_TITLE] or '',
+        '邮箱': values[COL_EMAIL] or '',
+        '录用': '录用' in statuses,
+        '发票': '发票' in statuses
+    }
+
+
+# 服务端筛选条件
+PAGE_FEE_FILTERS = {
+    'all': lambda record: True,
+    'unprocessed': lambda record: not (record['录用'] and record['发票']),
+    'accepted_only': lambda record: record['录用'] and not record['发票'],
+    'invoiced_only': lambda record: record['发票'] and not record['录用'],
+}
+
+
+def filter_records(records, filter_name='all', search=None, order='desc', offset=0, limit=None):
+    """
+    按状态筛选、按稿件编号/发票抬头搜索、排序并分页。
+    order 为 desc 时最新（文件末尾）的记录在前。返回 (筛选后的总数, 当前页记录)。
+    """
+    if filter_name not in PAGE_FEE_FILTERS:
+        raise ValueError(f"不支持的筛选条件: {filter_name}")
+    predicate = PAGE_FEE_FILTERS[filter_name]
+    search = (search or '').strip().lower()
+    matched = [
+        record for record in records
+        if predicate(record) and (not search or search in record['稿件编号'].lower()
+                                  or search in str(record['发票抬头']).lower())
+    ]
+    if order == 'desc':
+        matched.reverse()
+    end = None if limit is None else offset + limit
+    return len(matched), matched[offset:end]
+
+
+_read_cache = {}
+_read_cache_lock = threading.Lock()
+
+
+def read_page_fee_rows(path):
+    """
+    以只读流式模式读取版面费表的 A–K 列，跳过稿件编号为空的行。
+    返回 [(Excel 行号, 值元组), ...]；结果按文件修改时间和大小缓存，文件未变化时不再解析。
+    """
+    stat = os.stat(path)
+    version = (stat.st_mtime, stat.st_size)
+    with _read_cache_lock:
+        cached = _read_cache.get(path)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+    wb = load_workbook(path, read_only=True)
+    try:
+        ws = wb.active
+        rows = []
+        for row_number, row in enumerate(ws.iter_rows(min_row=2, max_col=COLUMN_COUNT, values_only=True), start=2):
+            if len(row) <= COL_ID or not row[COL_ID]:
+                continue
+            rows.append((row_number, tuple(row) + (None,) * (COLUMN_COUNT - len(row))))
+    finally:
+        wb.close()
+
+    with _read_cache_lock:
+        _read_cache[path] = (version, rows)
+    return rows
+
+
+class ChangeJournal:
+    """
+    版面费修改日志：只追加，每次修改（状态勾选、字段编辑）分配一个单调递增的版本号。
+    版本号从启动时的毫秒时间戳开始，服务重启前的版本号必然早于日志起点；
+    客户端版本早于保留范围、晚于当前版本，或数据被整体重新加载后，都要求客户端全量刷新。
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = deque()     # [(版本号, 稿件编号), ...]，按版本号递增
+        self._version = int(time.time() * 1000)
+        self._floor = self._version # 早于该版本的客户端无法增量同步
+        self._condition = threading.Condition()
+
+    @property
+    def version(self):
+        with self._condition:
+            return self._version
+
+    def append(self, manuscripts):
+        """记录一次修改涉及的稿件编号，返回新的版本号"""
+        with self._condition:
+            self._version += 1
+            for manuscript in manuscripts:
+                self._entries.append((self._version, manuscript))
+            while len(self._entries) > self.max_entries:
+                self._floor = self._entries.popleft()[0]
+            self._condition.notify_all()
+            return self._version
+
+    def reset(self):
+        """数据被整体替换（如文件被外部修改）时调用，之前的版本都需要全量刷新"""
+        with self._condition:
+            self._version += 1
+            self._entries.clear()
+            self._floor = self._version
+            self._condition.notify_all()
+
+    def since(self, version):
+        """返回 (当前版本, version 之后修改过的稿件编号列表, 是否需要全量刷新)"""
+        with self._condition:
+            if version < self._floor or version > self._version:
+                return self._version, [], True
+            changed = {}
+            for entry_version, manuscript in reversed(self._entries):
+                if entry_version <= version:
+                    break
+                changed[manuscript] = entry_version
+            # 按最后修改的先后排列
+            return self._version, sorted(changed, key=changed.get), False
+
+    def wait(self, version, timeout=None):
+        """等待版本号不再等于 version，超时返回 False"""
+        with self._condition:
+            return self._condition.wait_for(lambda: self._version != version, timeout)
+
+
+# 写入线程的队列消息
+_DELAYED_FLUSH = object()
+_STOP = object()
+
+
+class _FlushRequest:
+    """同步写回请求，写入线程完成后通知等待方"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.count = 0
+        self.error = None
+
+
+class PageFeeModel:
+    """
+    常驻内存的版面费数据，按稿件编号建立索引。
+    状态修改立即作用于内存；所有写回由唯一的写入线程串行执行，排队中的修改合并为一次保存
+    （程序退出时也会写回）。写回时持有进程间文件锁，并以临时文件替换的方式原子保存。
+    文件被外部修改时重新加载，尚未写回的修改会继续保留在新数据之上。
+    写回失败（如文件被 Excel 占用）时保留修改，按递增的间隔自动重试。
+    """
+
+    def __init__(self, path, flush_delay=2.0):
+        self.path = path
+        self.flush_delay = flush_delay
+        self._lock = threading.RLock()
+        self._rows = []          # [(Excel 行号, [A–K 列的值]), ...]，按文件顺序
+        self._index = {}         # 稿件编号 -> self._rows 中的位置
+        self._dirty = {}         # 稿件编号 -> {列位置: 新值}
+        self._duplicates = set() # 需要标记为重复的稿件编号
+        self._version = None
+        self._revision = 0       # 内存数据每次变化（加载或修改）递增
+        self._records_cache = (None, [])
+        self.journal = ChangeJournal()
+        self._flush_scheduled = False
+        self._flush_failures = 0  # 连续写回失败的次数，决定下次重试前的等待时间
+        self._queue = queue.Queue()
+        self._urgent = threading.Event()
+        self._writer = threading.Thread(target=self._writer_loop, name='page-fee-writer', daemon=True)
+        self._writer.start()
+
+    def _file_version(self):
+        stat = os.stat(self.path)
+        return (stat.st_mtime, stat.st_size)
+
+    def _load(self):
+        rows = read_page_fee_rows(self.path)
+        # 复制一份行数据，内存中的修改不影响读取缓存
+        rows = [(row_number, list(values)) for row_number, values in rows]
+        index = {}
+        for position, (_, values) in enumerate(rows):
+            index.setdefault(str(values[COL_ID]), position)
+        return rows, index
+
+    def _ensure_fresh(self):
+        """文件版本变化（外部修改或首次访问）时重新加载，并重新套用未写回的修改"""
+        version = self._file_version()
+        if version == self._version:
+            return
+        rows, index = self._load()
+        for manuscript, changes in self._dirty.items():
+            if manuscript in index:
+                values = rows[index[manuscript]][1]
+                for column, value in changes.items():
+                    values[column] = value
+        if self._version is not None:
+            self.journal.reset()
+        self._rows, self._index, self._version = rows, index, version
+        self._revision += 1
+        logging.info(f"已加载版面费数据: {self.path}, 共 {len(rows)} 条")
+
+    def records(self):
+        """按文件顺序返回页面使用的记录列表"""
+        with self._lock:
+            self._ensure_fresh()
+            revision, records = self._records_cache
+            if revision != self._revision:
+                records = [to_ui_record(values) for _, values in self._rows]
+                self._records_cache = (self._revision, records)
+            return list(records)
+
+    def etag(self):
+        """由文件版本和内存修改次数得到的数据版本标识，数据未变化时保持不变"""
+        with self._lock:
+            self._ensure_fresh()
+            mtime, size = self._version
+            return f"{mtime:.6f}-{size}-{self._revision}"
+
+    def query(self, filter_name='all', search=None, order='desc', offset=0, limit=None):
+        """服务端筛选和分页，返回 (总数, 记录列表)"""
+        return filter_records(self.records(), filter_name, search, order, offset, limit)
+
+    def change_version(self):
+        """当前的修改日志版本号，客户端据此增量同步"""
+        with self._lock:
+            self._ensure_fresh()
+            return self.journal.version
+
+    def changes(self, since):
+        """
+        返回 since 版本之后修改过的记录：{'version', 'reset', 'records'}。
+        reset 为 True 时客户端应重新加载全部数据。
+        """
+        with self._lock:
+            self._ensure_fresh()
+            version, manuscripts, reset = self.journal.since(since)
+            records = [to_ui_record(self._rows[self._index[manuscript]][1])
+                       for manuscript in manuscripts if manuscript in self._index]
+        return {'version': version, 'reset': reset, 'records': records}
+
+    def wait_for_changes(self, since, timeout=None):
+        """等待 since 版本之后出现新的修改，超时返回 False"""
+        return self.journal.wait(since, timeout)
+
+    def _set(self, manuscript, column, value):
+        self._revision += 1
+        self._rows[self._index[manuscript]][1][column] = value
+        self._dirty.setdefault(manuscript, {})[column] = value
+
+    def update_status(self, manuscript_number, status_type, is_checked):
+        """修改录用/发票状态；找不到稿件编号时返回 False"""
+        with self._lock:
+            self._ensure_fresh()
+            manuscript = str(manuscript_number)
+            if manuscript not in self._index:
+                return False
+            values = self._rows[self._index[manuscript]][1]
+            self._set(manuscript, COL_STATUS, apply_status_change(values[COL_STATUS] or '', status_type, is_checked))
+            self.journal.append([manuscript])
+            self._schedule_flush()
+            return True
+
+    def bulk_update(self, items):
+        """
+        批量修改可编辑字段，并记录需要标红的重复稿件，一次遍历完成。
+        返回 (已更新的稿件编号列表, 未找到的稿件编号列表)。修改随下一次写回保存。
+        """
+        with self._lock:
+            self._ensure_fresh()
+            updated, not_found = [], []
+            for item in items:
+                manuscript = str(item.get('稿件编号', ''))
+                if manuscript not in self._index:
+                    not_found.append(manuscript)
+                    continue
+                for field, column in EDITABLE_FIELDS.items():
+                    if field in item:
+                        self._set(manuscript, column, item[field])
+                if item.get('是否重复'):
+                    self._duplicates.add(manuscript)
+                updated.append(manuscript)
+            if updated:
+                self.journal.append(updated)
+                self._schedule_flush()
+            return updated, not_found
+
+    def _schedule_flush(self):
+        """请求一次延迟写回，flush_delay 内的修改合并到同一次保存"""
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            self._queue.put(_DELAYED_FLUSH)
+
+    def _writer_loop(self):
+        while True:
+            message = self._queue.get()
+            if message is _DELAYED_FLUSH:
+                # 等待更多修改进入队列；有同步写回请求时提前结束等待
+                delay = self.flush_delay
+                if self._flush_failures:
+                    delay = min(max(self.flush_delay, 1) * 2 ** self._flush_failures, FLUSH_RETRY_MAX_DELAY)
+                self._urgent.wait(delay)
+            self._urgent.clear()
+
+            messages = [message]
+            while True:
+                try:
+                    messages.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stopping = any(request is _STOP for request in messages)
+            count, error = 0, None
+            try:
+                count = self._write_pending()
+                self._flush_failures = 0
+            except Exception as e:
+                error = e
+                self._flush_failures += 1
+                logging.error(f"写回版面费文件时发生错误（第 {self._flush_failures} 次）: {str(e)}")
+                if not stopping:
+                    # 修改已放回待写列表，稍后自动重试，不必等下一次修改触发
+                    with self._lock:
+                        self._schedule_flush()
+            for request in messages:
+                if isinstance(request, _FlushRequest):
+                    request.count, request.error = count, error
+                    request.done.set()
+            if stopping:
+                break
+
+    def _write_pending(self):
+        """写入线程中执行：取出全部待写修改，加文件锁后一次性写回"""
+        with self._lock:
+            self._flush_scheduled = False
+            if not self._dirty and not self._duplicates:
+                return 0
+            self._ensure_fresh()
+            loaded_version = self._version
+            dirty, self._dirty = self._dirty, {}
+            duplicates, self._duplicates = self._duplicates, set()
+
+        try:
+            with file_lock(self.path):
+                # 加载内存数据后文件可能又被外部修改，这些修改会一起保存，但内存中还没有
+                externally_changed = self._file_version() != loaded_version
+                wb = load_workbook(self.path)
+                ws = wb.active
+                # 按稿件编号重新定位行（每次加载只建一次索引），文件在外部插入或删除行后仍能写到正确位置
+                row_numbers = {}
+                for row in ws.iter_rows(min_row=2, min_col=COL_ID + 1, max_col=COL_ID + 1):
+                    cell = row[0]
+                    if cell.value:
+                        row_numbers.setdefault(str(cell.value), cell.row)
+                for manuscript in dirty.keys() | duplicates:
+                    row_number = row_numbers.get(manuscript)
+                    if row_number is None:
+                        logging.warning(f"写回时未找到稿件编号: {manuscript}")
+                        continue
+                    for column, value in dirty.get(manuscript, {}).items():
+                        ws.cell(row=row_number, column=column + 1, value=value)
+                    if manuscript in duplicates:
+                        for column in range(1, ws.max_column + 1):
+                            cell = ws.cell(row=row_number, column=column)
+                            cell.fill = DUPLICATE_FILL
+                            cell.font = DUPLICATE_FONT
+                atomic_save_workbook(wb, self.path)
+                version = self._file_version()
+        except Exception:
+            # 写回失败时把修改放回待写列表，写回期间产生的新修改优先
+            with self._lock:
+                for manuscript, changes in dirty.items():
+                    self._dirty[manuscript] = {**changes, **self._dirty.get(manuscript, {})}
+                self._duplicates |= duplicates
+            raise
+
+        with self._lock:
+            if externally_changed or self._version != loaded_version:
+                # 保留旧的文件版本，下次访问时重新加载，外部修改不会被内存数据遮住
+                logging.info(f"版面费文件在写回前已被外部修改，将重新加载: {self.path}")
+            else:
+                # 内存数据已包含本次写回的内容，记录新的文件版本以免重新加载
+                self._version = version
+        count = len(dirty.keys() | duplicates)
+        logging.info(f"已写回版面费文件: {count} 条记录")
+        return count
+
+    def flush(self):
+        """同步写回：等待写入线程保存全部待写修改；没有修改时直接返回 0"""
+        with self._lock:
+            if not self._dirty and not self._duplicates:
+                return 0
+        if not self._writer.is_alive():
+            return self._write_pending()
+        request = _FlushRequest()
+        self._queue.put(request)
+        self._urgent.set()
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.count
+
+    def close(self):
+        """写回所有未保存的修改并停止写入线程"""
+        if self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._urgent.set()
+            self._writer.join()
+        self._write_pending()
+
+
+def create_page_fee_model(path, flush_delay=2.0):
+    """创建版面费模型，并在程序退出时写回未保存的修改"""
+    model = PageFeeModel(path, flush_delay)
+    atexit.register(model.close)
+    return model
@@ -0,0 +1,501 @@
+import os
+import json
+import atexit
+import sqlite3
+import logging
+import datetime
+import threading
+from openpyxl import load_workbook
+from openpyxl.cell.cell import MergedCell
+from page_fee import (
+    COLUMN_COUNT, COL_ID, COL_STATUS, EDITABLE_FIELDS, DUPLICATE_FILL, DUPLICATE_FONT,
+    apply_status_change, filter_records, read_page_fee_rows, to_ui_record
+)
+from report_writer import ReportWriter
+from utils import file_lock, atomic_save_workbook
+
+# A–K 列在数据库中的字段名
+COLUMNS = [
+    'remark', 'manuscript_id', 'verify_no', 'col_d', 'invoice_title', 'finance_remark',
+    'tax_no', 'email', 'col_i', 'col_j', 'status'
+]
+
+# 数字和文本以外的单元格值：类型标记 -> (判断, 存入数据库, 从数据库还原)。
+# 类型标记保存在 value_types 列（{字段名: 类型标记}），导出时还原为原来的类型；datetime 须在 date 之前判断
+VALUE_TYPES = {
+    'bool': (lambda v: isinstance(v, bool), int, bool),
+    'datetime': (lambda v: isinstance(v, datetime.datetime), datetime.datetime.isoformat, datetime.datetime.fromisoformat),
+    'date': (lambda v: isinstance(v, datetime.date), datetime.date.isoformat, datetime.date.fromisoformat),
+    'time': (lambda v: isinstance(v, datetime.time), datetime.time.isoformat, datetime.time.fromisoformat),
+    'timedelta': (lambda v: isinstance(v, datetime.timedelta), lambda v: v.total_seconds(),
+                  lambda v: datetime.timedelta(seconds=v)),
+}
+
+# 页面上可以修改的列；重新导入时尚未导出的修改保留这些列的值
+APP_COLUMNS = [COLUMNS[column] for column in (*EDITABLE_FIELDS.values(), COL_STATUS)]
+
+CHANGE_LOG_KEEP = 1000  # 修改日志至少保留最近多少个版本，更早的版本请求增量同步时改为全量刷新
+CHANGE_LOG_PRUNE_EVERY = 100  # 每隔多少个版本清理一次修改日志
+
+
+class WorkbookChangedError(RuntimeError):
+    """导入后 xlsx 在外部被修改过，导出会覆盖这些修改"""
+
+
+class PageFeeStore:
+    """
+    版面费数据的 SQLite 存储，接口与 page_fee.PageFeeModel 一致。
+    修改按行更新数据库；可从现有 xlsx（A–K 列）导入，并按需或定时导出。
+    导出时以导入的 xlsx 为模板只更新 A–K 列中变化的单元格，其他工作表、列宽、格式和公式保持不变；
+    导入后 xlsx 在外部被修改过时拒绝导出，需要先重新导入；重新导入按稿件编号合并，尚未导出的修改会保留。
+    修改日志保存在 page_fee_changes 表中，版本号即 page_fee_meta 中的 revision，重启后仍可增量同步；
+    已导出且超出保留范围的日志会被清理，更早的版本改为全量刷新。
+    """
+
+    def __init__(self, db_path, export_path=None, export_interval=None):
+        self.db_path = db_path
+        self.export_path = export_path
+        self.export_interval = export_interval
+        self._lock = threading.Lock()
+        self._changed = threading.Condition()
+        self._timer = None
+        self._create_tables()
+        if export_path and export_interval:
+            self._schedule_export()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _create_tables(self):
+        conn = self._connect()
+        try:
+            conn.executescript(f'''
+                CREATE TABLE IF NOT EXISTS page_fees (
+                    row_number INTEGER PRIMARY KEY,
+                    manuscript_key TEXT NOT NULL,
+                    {', '.join(COLUMNS)},
+                    is_duplicate INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS idx_page_fees_manuscript_key ON page_fees (manuscript_key);
+                CREATE INDEX IF NOT EXISTS idx_page_fees_status ON page_fees (status);
+                -- 修改日志：manuscript_key 为空表示整体导入，之前的版本需要全量刷新
+                CREATE TABLE IF NOT EXISTS page_fee_changes (
+                    revision INTEGER NOT NULL,
+                    manuscript_key TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_page_fee_changes_revision ON page_fee_changes (revision);
+                CREATE TABLE IF NOT EXISTS page_fee_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                );
+                INSERT OR IGNORE INTO page_fee_meta (key, value) VALUES ('revision', '0');
+            ''')
+            # 旧版本建的表没有类型标记列
+            if 'value_types' not in {row['name'] for row in conn.execute("PRAGMA table_info(page_fees)")}:
+                conn.execute("ALTER TABLE page_fees ADD COLUMN value_types TEXT")
+            # 没有导出记录时视为当前版本已导出，避免启动后没有修改也覆盖 xlsx
+            conn.execute("""
+                INSERT OR IGNORE INTO page_fee_meta (key, value)
+                SELECT 'exported_revision', value FROM page_fee_meta WHERE key = 'revision'
+            """)
+            conn.commit()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _get_meta(conn, key):
+        row = conn.execute("SELECT value FROM page_fee_meta WHERE key = ?", (key,)).fetchone()
+        return row['value'] if row else None
+
+    @staticmethod
+    def _set_meta(conn, key, value):
+        conn.execute("INSERT OR REPLACE INTO page_fee_meta (key, value) VALUES (?, ?)", (key, value))
+
+    @staticmethod
+    def _file_version(path):
+        stat = os.stat(path)
+        return [stat.st_mtime, stat.st_size]
+
+    def _exported_revision(self, conn):
+        return int(self._get_meta(conn, 'exported_revision') or 0)
+
+    def _bump_revision(self, cursor, manuscripts=None):
+        """递增数据版本并写入修改日志；manuscripts 为 None 表示整体替换"""
+        cursor.execute("UPDATE page_fee_meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'revision'")
+        revision = cursor.execute("SELECT value FROM page_fee_meta WHERE key = 'revision'").fetchone()[0]
+        cursor.executemany("INSERT INTO page_fee_changes (revision, manuscript_key) VALUES (?, ?)",
+                           [(revision, manuscript) for manuscript in (manuscripts if manuscripts is not None else [None])])
+        if int(revision) % CHANGE_LOG_PRUNE_EVERY == 0:
+            self._prune_changes(cursor)
+
+    def _prune_changes(self, cursor):
+        """
+        删除已导出、且早于最近 CHANGE_LOG_KEEP 个版本的修改日志。
+        清理到的版本记为 pruned_revision，更早的版本请求增量同步时返回全量刷新。
+        """
+        revision = int(self._get_meta(cursor, 'revision'))
+        floor = min(self._exported_revision(cursor), revision - CHANGE_LOG_KEEP)
+        if floor <= int(self._get_meta(cursor, 'pruned_revision') or 0):
+            return
+        cursor.execute("DELETE FROM page_fee_changes WHERE revision <= ?", (floor,))
+        self._set_meta(cursor, 'pruned_revision', str(floor))
+
+    def _notify_changed(self):
+        with self._changed:
+            self._changed.notify_all()
+
+    def _revision(self, conn):
+        return int(conn.execute("SELECT value FROM page_fee_meta WHERE key = 'revision'").fetchone()['value'])
+
+    def is_empty(self):
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT 1 FROM page_fees LIMIT 1").fetchone() is None
+        finally:
+            conn.close()
+
+    def import_workbook(self, path):
+        """
+        从版面费 xlsx 导入全部记录，返回导入条数。
+        按稿件编号合并：上次导出后在页面上修改过的稿件保留页面可修改的列和重复标记，其他列以 xlsx 为准；
+        xlsx 中已没有的这类稿件追加在末尾，修改不会因重新导入而丢失。
+        """
+        wb = load_workbook(path, read_only=True)
+        try:
+            header = next(wb.active.iter_rows(min_row=1, max_row=1, max_col=COLUMN_COUNT, values_only=True), ())
+        finally:
+            wb.close()
+        header = list(header) + [None] * (COLUMN_COUNT - len(header))
+        version = self._file_version(path)
+        rows = read_page_fee_rows(path)
+
+        with self._lock:
+            conn = self._connect()
+            try:
+                cursor = conn.cursor()
+                pending = self._unexported_rows(conn)
+                db_rows = self._merge_rows(rows, pending)
+                cursor.execute("DELETE FROM page_fees")
+                cursor.executemany(
+                    f"INSERT INTO page_fees (row_number, manuscript_key, {', '.join(COLUMNS)}, value_types, is_duplicate) "
+                    f"VALUES ({', '.join('?' * (len(COLUMNS) + 4))})",
+                    db_rows
+                )
+                self._set_meta(conn, 'header', json.dumps(header, ensure_ascii=False, default=str))
+                # 记录导入时 xlsx 的修改时间和大小，导出前据此判断文件是否在外部被修改
+                self._set_meta(conn, 'source', json.dumps({'path': os.path.abspath(path), 'version': version}))
+                self._bump_revision(cursor)
+                # 保留了未导出的修改时 xlsx 与数据库仍不一致，下次定时导出时写回
+                if not pending and self.export_path and os.path.abspath(self.export_path) == os.path.abspath(path):
+                    self._set_meta(conn, 'exported_revision', str(self._revision(conn)))
+                conn.commit()
+            finally:
+                conn.close()
+        self._notify_changed()
+        if pending:
+            logging.info(f"重新导入时保留了 {len(pending)} 条尚未导出的修改")
+        logging.info(f"已从 {path} 导入版面费记录 {len(rows)} 条")
+        return len(rows)
+
+    def _unexported_rows(self, conn):
+        """上次导出后修改过的稿件：稿件编号 -> 数据库中的行（同一稿件编号以第一行为准）"""
+        keys = [row['manuscript_key'] for row in conn.execute(
+            "SELECT DISTINCT manuscript_key FROM page_fee_changes WHERE revision > ? AND manuscript_key IS NOT NULL",
+            (self._exported_revision(conn),))]
+        pending = {}
+        for key in keys:
+            row = conn.execute("SELECT * FROM page_fees WHERE manuscript_key = ? ORDER BY row_number LIMIT 1",
+                               (key,)).fetchone()
+            if row is not None:
+                pending[key] = row
+        return pending
+
+    def _merge_rows(self, rows, pending):
+        """xlsx 的行 -> 待写入数据库的行，pending 中的稿件保留数据库中页面可修改的列"""
+        db_rows, merged = [], set()
+        for row_number, values in rows:
+            key = str(values[COL_ID])
+            db_values = self._to_db(values)
+            is_duplicate = 0
+            kept = pending.get(key) if key not in merged else None
+            if kept is not None:
+                merged.add(key)
+                types = json.loads(db_values[-1]) if db_values[-1] else {}
+                kept_types = json.loads(kept['value_types']) if kept['value_types'] else {}
+                for column in APP_COLUMNS:
+                    db_values[COLUMNS.index(column)] = kept[column]
+                    types.pop(column, None)
+                    if column in kept_types:
+                        types[column] = kept_types[column]
+                db_values[-1] = json.dumps(types) if types else None
+                is_duplicate = kept['is_duplicate']
+            db_rows.append((row_number, key, *db_values, is_duplicate))
+
+        next_row = max((row[0] for row in db_rows), default=1) + 1
+        for key, kept in pending.items():
+            if key in merged:
+                continue
+            logging.warning(f"重新导入的版面费表中没有稿件编号 {key}，保留其尚未导出的修改并追加在末尾")
+            db_rows.append((next_row, key, *(kept[column] for column in COLUMNS), kept['value_types'], kept['is_duplicate']))
+            next_row += 1
+        return db_rows
+
+    @staticmethod
+    def _to_db(values):
+        """一行单元格值 -> A–K 列的数据库值和类型标记（JSON，没有需要标记的值时为 None）"""
+        db_values, types = [], {}
+        for column, value in zip(COLUMNS, values):
+            if value is None or (isinstance(value, (int, float, str)) and not isinstance(value, bool)):
+                db_values.append(value)
+                continue
+            for tag, (matches, encode, _) in VALUE_TYPES.items():
+                if matches(value):
+                    db_values.append(encode(value))
+                    types[column] = tag
+                    break
+            else:
+                logging.warning(f"无法保留的单元格类型 {type(value).__name__}，按文本保存: {value}")
+                db_values.append(str(value))
+        return db_values + [json.dumps(types) if types else None]
+
+    @staticmethod
+    def _from_db(row):
+        """数据库中的一行 -> A–K 列的单元格值（按类型标记还原）"""
+        types = json.loads(row['value_types']) if row['value_types'] else {}
+        return [VALUE_TYPES[types[column]][2](row[column]) if column in types and row[column] is not None else row[column]
+                for column in COLUMNS]
+
+    @staticmethod
+    def _clear_types(value_types, columns):
+        """页面修改的字段都是文本，去掉这些字段的类型标记"""
+        types = json.loads(value_types) if value_types else {}
+        for column in columns:
+            types.pop(column, None)
+        return json.dumps(types) if types else None
+
+    def export_workbook(self, path=None):
+        """
+        导出为 xlsx，重复稿件整行标红，返回导出的文件路径。
+        有导入的 xlsx 时以它为模板，只更新 A–K 列中变化的单元格；导入后它在外部被修改过时抛出 WorkbookChangedError。
+        """
+        path = path or self.export_path
+        if not path:
+            raise ValueError("未配置版面费导出路径")
+        conn = self._connect()
+        try:
+            source = self._get_meta(conn, 'source')
+            source = json.loads(source) if source else None
+            revision = self._revision(conn)
+            rows = conn.execute(
+                f"SELECT row_number, {', '.join(COLUMNS)}, value_types, is_duplicate FROM page_fees ORDER BY row_number"
+            ).fetchall()
+            # 与 xlsx 模式的写回共用文件锁，两种方式都以临时文件替换的方式保存
+            with file_lock(path):
+                if source and os.path.exists(source['path']):
+                    if self._file_version(source['path']) != source['version']:
+                        raise WorkbookChangedError(
+                            f"{source['path']} 在导入后已被修改，为避免覆盖这些修改已停止导出，"
+                            f"请先重新导入（尚未导出的修改会保留）")
+                    self._export_in_place(source['path'], path, rows)
+                else:
+                    header = json.loads(self._get_meta(conn, 'header') or 'null') or COLUMNS
+                    with ReportWriter(path) as writer:
+                        writer.append(header)
+                        for row in rows:
+                            if row['is_duplicate']:
+                                writer.append_styled(self._from_db(row), fill=DUPLICATE_FILL, font=DUPLICATE_FONT)
+                            else:
+                                writer.append(self._from_db(row))
+                if source and os.path.abspath(path) == source['path']:
+                    source['version'] = self._file_version(path)
+                    self._set_meta(conn, 'source', json.dumps(source))
+            self._set_meta(conn, 'exported_revision', str(revision))
+            self._prune_changes(conn)
+            conn.commit()
+        finally:
+            conn.close()
+        logging.info(f"已导出版面费数据: {path}")
+        return path
+
+    def _export_in_place(self, template_path, path, rows):
+        """以 template_path 为模板，只改写值有变化的单元格，保存到 path"""
+        wb = load_workbook(template_path)
+        ws = wb.active
+        for row in rows:
+            row_number = row['row_number']
+            for column, value in enumerate(self._from_db(row), start=1):
+                cell = ws.cell(row=row_number, column=column)
+                if not isinstance(cell, MergedCell) and cell.value != value:
+                    cell.value = value
+            if row['is_duplicate']:
+                for column in range(1, ws.max_column + 1):
+                    cell = ws.cell(row=row_number, column=column)
+                    cell.fill = DUPLICATE_FILL
+                    cell.font = DUPLICATE_FONT
+        atomic_save_workbook(wb, path)
+
+    def _needs_export(self):
+        conn = self._connect()
+        try:
+            return self._revision(conn) != self._exported_revision(conn)
+        finally:
+            conn.close()
+
+    def _schedule_export(self):
+        self._timer = threading.Timer(self.export_interval, self._timer_export)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _timer_export(self):
+        try:
+            if self._needs_export():
+                self.export_workbook()
+        except Exception as e:
+            logging.error(f"定时导出版面费数据时发生错误: {str(e)}")
+        finally:
+            self._schedule_export()
+
+    def records(self):
+        """按 Excel 行顺序返回页面使用的记录列表"""
+        conn = self._connect()
+        try:
+            rows = conn.execute(f"SELECT {', '.join(COLUMNS)}, value_types FROM page_fees ORDER BY row_number").fetchall()
+        finally:
+            conn.close()
+        return [to_ui_record(self._from_db(row)) for row in rows]
+
+    def etag(self):
+        conn = self._connect()
+        try:
+            return str(self._revision(conn))
+        finally:
+            conn.close()
+
+    def query(self, filter_name='all', search=None, order='desc', offset=0, limit=None):
+        return filter_records(self.records(), filter_name, search, order, offset, limit)
+
+    def change_version(self):
+        return int(self.etag())
+
+    def changes(self, since):
+        """返回 since 版本之后修改过的记录：{'version', 'reset', 'records'}，与 PageFeeModel.changes 一致"""
+        conn = self._connect()
+        try:
+            version = self._revision(conn)
+            pruned = int(self._get_meta(conn, 'pruned_revision') or 0)
+            reset = since > version or since < pruned or conn.execute(
+                "SELECT 1 FROM page_fee_changes WHERE revision > ? AND manuscript_key IS NULL LIMIT 1", (since,)
+            ).fetchone() is not None
+            if reset:
+                return {'version': version, 'reset': True, 'records': []}
+            rows = conn.execute(f"""
+                SELECT {', '.join(COLUMNS)}, value_types, last_revision FROM page_fees
+                JOIN (SELECT manuscript_key, MAX(revision) AS last_revision FROM page_fee_changes
+                      WHERE revision > ? GROUP BY manuscript_key) USING (manuscript_key)
+                ORDER BY last_revision, row_number
+            """, (since,)).fetchall()
+        finally:
+            conn.close()
+        # 同一稿件编号以第一行为准，与修改时定位的行一致
+        records, seen = [], set()
+        for row in rows:
+            record = to_ui_record(self._from_db(row))
+            if record['稿件编号'] not in seen:
+                seen.add(record['稿件编号'])
+                records.append(record)
+        return {'version': version, 'reset': False, 'records': records}
+
+    def wait_for_changes(self, since, timeout=None):
+        """等待 since 版本之后出现新的修改，超时返回 False；等待期间的每次检查共用一个连接"""
+        conn = self._connect()
+        try:
+            with self._changed:
+                return self._changed.wait_for(lambda: self._revision(conn) != since, timeout)
+        finally:
+            conn.close()
+
+    def update_status(self, manuscript_number, status_type, is_checked):
+        """修改录用/发票状态；找不到稿件编号时返回 False"""
+        with self._lock:
+            conn = self._connect()
+            try:
+                cursor = conn.cursor()
+                row = cursor.execute(
+                    "SELECT row_number, status, value_types FROM page_fees WHERE manuscript_key = ? ORDER BY row_number LIMIT 1",
+                    (str(manuscript_number),)
+                ).fetchone()
+                if row is None:
+                    return False
+                cursor.execute("UPDATE page_fees SET status = ?, value_types = ? WHERE row_number = ?",
+                               (apply_status_change(row['status'] or '', status_type, is_checked),
+                                self._clear_types(row['value_types'], ['status']), row['row_number']))
+                self._bump_revision(cursor, [str(manuscript_number)])
+                conn.commit()
+            finally:
+                conn.close()
+        self._notify_changed()
+        return True
+
+    def bulk_update(self, items):
+        """批量修改可编辑字段和重复标记，在一个事务中完成；返回 (已更新列表, 未找到列表)"""
+        with self._lock:
+            conn = self._connect()
+            try:
+                cursor = conn.cursor()
+                updated, not_found = [], []
+                for item in items:
+                    manuscript = str(item.get('稿件编号', ''))
+                    row = cursor.execute(
+                        "SELECT row_number, value_types FROM page_fees WHERE manuscript_key = ? ORDER BY row_number LIMIT 1",
+                        (manuscript,)
+                    ).fetchone()
+                    if row is None:
+                        not_found.append(manuscript)
+                        continue
+                    assignments = {COLUMNS[column]: item[field] for field, column in EDITABLE_FIELDS.items() if field in item}
+                    if assignments:
+                        assignments['value_types'] = self._clear_types(row['value_types'], list(assignments))
+                    if item.get('是否重复'):
+                        assignments['is_duplicate'] = 1
+                    if assignments:
+                        cursor.execute(
+                            f"UPDATE page_fees SET {', '.join(f'{column} = ?' for column in assignments)} WHERE row_number = ?",
+                            (*assignments.values(), row['row_number'])
+                        )
+                    updated.append(manuscript)
+                if updated:
+                    self._bump_revision(cursor, updated)
+                conn.commit()
+            finally:
+                conn.close()
+        if updated:
+            self._notify_changed()
+        return updated, not_found
+
+    def flush(self):
+        """修改已实时写入数据库，无需写回"""
+        return 0
+
+    def close(self):
+        """停止定时导出；配置了导出路径时导出最后一次修改"""
+        if self._timer is not None:
+            self._timer.cancel()
+        if self.export_path and self._needs_export():
+            try:
+                self.export_workbook()
+            except WorkbookChangedError as e:
+                logging.error(f"退出时未导出版面费数据: {e}")
+
+
+def create_page_fee_store(db_path, workbook_path, export_interval=None):
+    """
+    创建 SQLite 版面费存储：数据库为空时从 workbook_path 导入，
+    之后有修改时定时（以及程序退出时）在 workbook_path 中原位更新 A–K 列。
+    """
+    store = PageFeeStore(db_path, export_path=workbook_path, export_interval=export_interval)
+    if store.is_empty() and os.path.exists(workbook_path):
+        store.import_workbook(workbook_path)
+    atexit.register(store.close)
+    return store
@@ -0,0 +1,177 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from article_db import connect
+
+logger = logging.getLogger(__name__)
+
+
+class PdfStore:
+    """
+    按内容寻址的PDF存储：文件按 SHA256 保存为 objects/<前两位>/<哈希>.pdf，内容相同的PDF只保存一份，
+    稿件编号到哈希的对应关系记录在数据库中。未下载完的文件保存在 partial/ 下，可以断点续传，
+    旁边的 .meta 文件记录开始下载时服务器返回的 ETag/Last-Modified，续传时用来确认文件未变。
+    max_bytes 为总大小上限（None 表示全部保留），超出时按最近使用时间删除最久未用的文件，
+    min_age 秒内使用过的文件不删除，避免删掉正在等待处理的PDF。
+    """
+
+    def __init__(self, root, db_path, max_bytes=None, min_age=3600):
+        self.root = root
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.min_age = min_age
+        self._lock = threading.Lock()
+        self._schema_ready = False
+
+    def _connect(self):
+        conn = connect(self.db_path)
+        if not self._schema_ready:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS pdf_objects (
+                    sha256 TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_pdf_objects_last_access ON pdf_objects (last_access);
+                CREATE TABLE IF NOT EXISTS article_pdfs (
+                    article_id TEXT PRIMARY KEY,
+                    sha256 TEXT NOT NULL,
+                    url TEXT
+                );
+            ''')
+            self._schema_ready = True
+        return conn
+
+    def object_path(self, sha256):
+        return os.path.join(self.root, 'objects', sha256[:2], f"{sha256}.pdf")
+
+    def contains(self, path):
+        """path 是否为存储中的文件"""
+        objects_dir = os.path.abspath(os.path.join(self.root, 'objects'))
+        return os.path.abspath(path).startswith(objects_dir + os.sep)
+
+    def partial_path(self, key):
+        """key（通常为稿件编号）对应的未完成下载文件"""
+        path = os.path.join(self.root, 'partial', f"{key}.part")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def partial_validator(self, key):
+        """返回未完成下载的校验信息 {'etag': ..., 'last_modified': ...}；没有记录或无法读取时返回 None"""
+        try:
+            with open(self.partial_path(key) + '.meta', 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_partial_validator(self, key, etag=None, last_modified=None):
+        """记录未完成下载的校验信息；两者都没有时删除旧记录（此时无法安全续传）"""
+        meta_path = self.partial_path(key) + '.meta'
+        if not etag and not last_modified:
+            self.discard_partial(key, keep_data=True)
+            return
+        tmp_path = meta_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'etag': etag, 'last_modified': last_modified}, f)
+        os.replace(tmp_path, meta_path)
+
+    def discard_partial(self, key, keep_data=False):
+        """删除未完成的下载及其校验信息；keep_data 为 True 时只删除校验信息"""
+        partial = self.partial_path(key)
+        for path in ((partial + '.meta',) if keep_data else (partial, partial + '.meta')):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def lookup(self, article_id):
+        """返回稿件已保存的PDF路径并更新最近使用时间；没有保存或文件已删除时返回 None"""
+        with self._lock:
+            conn = self._connect()
+            try:
+                row = conn.execute("SELECT sha256 FROM article_pdfs WHERE article_id = ?", (article_id,)).fetchone()
+                if row is None:
+                    return None
+                path = self.object_path(row['sha256'])
+                if not os.path.exists(path):
+                    conn.execute("DELETE FROM pdf_objects WHERE sha256 = ?", (row['sha256'],))
+                    conn.commit()
+                    return None
+                conn.execute("UPDATE pdf_objects SET last_access = ? WHERE sha256 = ?", (time.time(), row['sha256']))
+                conn.commit()
+                return path
+            finally:
+                conn.close()
+
+    @staticmethod
+    def _file_digest(path, chunk_size=1024 * 1024):
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    def commit_partial(self, article_id, url=None):
+        """下载完成后把 partial 文件移入存储（内容已存在时直接复用），返回PDF路径"""
+        partial = self.partial_path(article_id)
+        sha256 = self._file_digest(partial)
+        size = os.path.getsize(partial)
+        path = self.object_path(sha256)
+        with self._lock:
+            if os.path.exists(path):
+                os.remove(partial)
+                logger.info(f"PDF内容与已保存的文件相同，复用: {path}")
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(partial, path)
+            self.discard_partial(article_id)
+            conn = self._connect()
+            try:
+                conn.execute("INSERT OR REPLACE INTO pdf_objects (sha256, size, last_access) VALUES (?, ?, ?)",
+                             (sha256, size, time.time()))
+                conn.execute("INSERT OR REPLACE INTO article_pdfs (article_id, sha256, url) VALUES (?, ?, ?)",
+                             (article_id, sha256, url))
+                conn.commit()
+            finally:
+                conn.close()
+        self.prune()
+        return path
+
+    def total_size(self):
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT COALESCE(SUM(size), 0) FROM pdf_objects").fetchone()[0]
+        finally:
+            conn.close()
+
+    def prune(self):
+        """总大小超过 max_bytes 时按最近使用时间删除文件，返回删除的文件数"""
+        if self.max_bytes is None:
+            return 0
+        removed = 0
+        with self._lock:
+            conn = self._connect()
+            try:
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM pdf_objects").fetchone()[0]
+                if total <= self.max_bytes:
+                    return 0
+                cutoff = time.time() - self.min_age
+                for row in conn.execute("SELECT sha256, size FROM pdf_objects WHERE last_access < ? ORDER BY last_access",
+                                        (cutoff,)).fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    path = self.object_path(row['sha256'])
+                    if os.path.exists(path):
+                        os.remove(path)
+                    conn.execute("DELETE FROM pdf_objects WHERE sha256 = ?", (row['sha256'],))
+                    total -= row['size']
+                    removed += 1
+                conn.commit()
+            finally:
+                conn.close()
+        if removed:
+            logger.info(f"PDF存储超出大小上限，已删除 {removed} 个最久未用的文件")
+        return removed
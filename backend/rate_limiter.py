@@ -0,0 +1,114 @@
+import time
+import threading
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+
+def parse_retry_after(value):
+    """解析 Retry-After 响应头（秒数或 HTTP 日期），无法解析时返回 None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    令牌桶：每秒补充 rate 个令牌，最多积累 capacity 个，每个请求消耗一个。
+    rate 可在运行中调整；cooldown 期间不发放令牌。
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """阻塞直到取得一个令牌"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._blocked_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = max(self._blocked_until - now, (1 - self._tokens) / self.rate)
+            time.sleep(wait)
+
+    def set_rate(self, rate):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = rate
+
+    def cooldown(self, seconds):
+        """seconds 秒内暂停发放令牌，并清空已积累的令牌"""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+
+
+class HostRateLimiter:
+    """
+    按主机限速：每个主机一个令牌桶。
+    请求出错、返回 429/5xx 或响应过慢时速率减半（出错和 429 还会暂停一段时间，按 Retry-After 或指数退避），
+    之后每个正常响应把速率逐步恢复到上限。
+    """
+
+    def __init__(self, rate=2.0, burst=4, min_rate=0.2, slow_threshold=5.0, max_backoff=60.0):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.slow_threshold = slow_threshold
+        self.max_backoff = max_backoff
+        self._buckets = {}
+        self._failures = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, host):
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = self._buckets[host] = TokenBucket(self.rate, self.burst)
+            return bucket
+
+    def acquire(self, url):
+        self._bucket(urlsplit(url).netloc).acquire()
+
+    def record(self, url, status=None, elapsed=None, error=False, retry_after=None):
+        """根据一次请求的结果调整该主机的速率"""
+        host = urlsplit(url).netloc
+        bucket = self._bucket(host)
+        throttled = error or status == 429 or (status is not None and status >= 500)
+        slow = elapsed is not None and elapsed > self.slow_threshold
+        with self._lock:
+            if throttled:
+                self._failures[host] = self._failures.get(host, 0) + 1
+            elif not slow:
+                self._failures[host] = 0
+            failures = self._failures.get(host, 0)
+
+        if throttled or slow:
+            bucket.set_rate(max(self.min_rate, bucket.rate / 2))
+            if throttled:
+                delay = parse_retry_after(retry_after)
+                if delay is None:
+                    delay = min(self.max_backoff, 2 ** failures)
+                bucket.cooldown(min(self.max_backoff, delay))
+        elif bucket.rate < self.rate:
+            bucket.set_rate(min(self.rate, bucket.rate + self.rate / 10))
+
+    def current_rate(self, url):
+        return self._bucket(urlsplit(url).netloc).rate
@@ -0,0 +1,130 @@
+import os
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+AMOUNT_FORMAT = '#,##0.00'
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def _clean(value):
+    """NaN/NaT 写为空单元格，与 DataFrame.to_excel 一致"""
+    try:
+        if pd.isna(value):
+            return None
+    except (TypeError, ValueError):
+        pass
+    return value
+
+
+class ReportWriter:
+    """
+    基于 openpyxl 只写模式的报表写出器。
+    行写出后即序列化到临时文件，内存占用不随行数增长；保存时先写临时文件再替换目标文件。
+    """
+
+    def __init__(self, path, sheet_name='Sheet1'):
+        self.path = path
+        self.workbook = Workbook(write_only=True)
+        self.worksheet = self.workbook.create_sheet(sheet_name)
+        self.bold_font = Font(bold=True)
+        self.rows_written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.save()
+        else:
+            self.workbook.close()
+        return False
+
+    def _cell(self, value, bold=False, number_format=None, fill=None, font=None):
+        cell = WriteOnlyCell(self.worksheet, value=_clean(value))
+        if bold:
+            cell.font = self.bold_font
+        if font is not None:
+            cell.font = font
+        if fill is not None:
+            cell.fill = fill
+        if number_format:
+            cell.number_format = number_format
+        return cell
+
+    def append(self, values):
+        self.worksheet.append([_clean(value) for value in values])
+        self.rows_written += 1
+
+    def append_styled(self, values, bold=False, amount_columns=(), fill=None, font=None):
+        """写入一行带样式的单元格，amount_columns 为需要金额格式的列序号（从 0 开始）"""
+        self.worksheet.append([
+            self._cell(value, bold=bold, number_format=AMOUNT_FORMAT if i in amount_columns else None,
+                       fill=fill, font=font)
+            for i, value in enumerate(values)
+        ])
+        self.rows_written += 1
+
+    def blank_rows(self, count=1):
+        for _ in range(count):
+            self.worksheet.append([])
+            self.rows_written += 1
+
+    def write_header(self, columns):
+        self.append_styled(columns, bold=True)
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def write_records(self, records):
+        """写入字典列表（表头取自第一条记录的键），不经过 DataFrame"""
+        columns = None
+        for record in records:
+            if columns is None:
+                columns = list(record.keys())
+                self.write_header(columns)
+            self.append([record.get(column) for column in columns])
+
+    def write_dataframe(self, df, chunk_size=DEFAULT_CHUNK_SIZE):
+        """按块写入 DataFrame，包含表头，不写索引"""
+        self.write_header(df.columns.tolist())
+        for start in range(0, len(df), chunk_size):
+            chunk = df.iloc[start:start + chunk_size]
+            self.write_rows(chunk.itertuples(index=False, name=None))
+
+    def write_summary_block(self, title_row, rows, total_label, total, amount_column=2):
+        """
+        写入一个统计块：加粗的表头行、明细行、加粗的合计行，块后空一行。
+        amount_column 为金额所在列（从 0 开始），明细和合计都使用金额格式。
+        """
+        self.append_styled(title_row, bold=True)
+        for row in rows:
+            self.append_styled(row, amount_columns=(amount_column,))
+        total_row = [total_label] + [None] * (amount_column - 1) + [total]
+        self.append_styled(total_row, bold=True, amount_columns=(amount_column,))
+        self.blank_rows(1)
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        self.workbook.save(tmp_path)
+        os.replace(tmp_path, self.path)
+        return self.path
+
+
+def write_records_to_excel(path, records, sheet_name='Sheet1'):
+    """将字典列表流式写出为 Excel 文件"""
+    with ReportWriter(path, sheet_name) as writer:
+        writer.write_records(records)
+    return path
+
+
+def write_dataframe_to_excel(path, df, sheet_name='Sheet1'):
+    """将 DataFrame 流式写出为 Excel 文件"""
+    with ReportWriter(path, sheet_name) as writer:
+        writer.write_dataframe(df)
+    return path
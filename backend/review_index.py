@@ -0,0 +1,158 @@
+import os
+import bisect
+import pickle
+import hashlib
+import logging
+import threading
+from excel_cache import CACHE_DIR, read_excel_cached
+
+RESULT_COLUMNS = ['稿件编号', '审稿人姓名', '审回时间']
+SHEETS = ('review', 're_review')
+SEARCH_MODES = ('auto', 'exact', 'prefix', 'partial')
+
+
+class _SheetIndex:
+    """单张审稿表的倒排索引：稿件编号/审稿人姓名 -> 行号"""
+
+    def __init__(self):
+        self.version = None
+        self.rows = []
+        self.by_id = {}
+        self.by_name = {}
+        self.sorted_ids = []
+        self.sorted_names = []
+
+    def update(self, df, version):
+        """
+        用新读取的表格更新索引。
+        新表只是在旧表后追加行时只索引新增部分，否则整表重建。
+        """
+        df = df[RESULT_COLUMNS].copy()
+        df['稿件编号'] = df['稿件编号'].astype(str)
+        df = df.astype(object).where(df.notna(), None)
+        rows = list(df.itertuples(index=False, name=None))
+
+        start = len(self.rows)
+        if len(rows) < start or rows[:start] != self.rows:
+            self.rows, self.by_id, self.by_name = [], {}, {}
+            start = 0
+        self.rows.extend(rows[start:])
+        for i in range(start, len(self.rows)):
+            manuscript_id, reviewer = self.rows[i][0], self.rows[i][1]
+            self.by_id.setdefault(manuscript_id, []).append(i)
+            if reviewer is not None:
+                self.by_name.setdefault(reviewer, []).append(i)
+        self.sorted_ids = sorted(self.by_id)
+        self.sorted_names = sorted(self.by_name)
+        self.version = version
+        return len(self.rows) - start
+
+    @staticmethod
+    def _prefix_range(sorted_keys, prefix):
+        start = bisect.bisect_left(sorted_keys, prefix)
+        end = bisect.bisect_left(sorted_keys, prefix + '\uffff')
+        return sorted_keys[start:end]
+
+    def search(self, query, mode):
+        hits = set(self.by_id.get(query, ())) | set(self.by_name.get(query, ()))
+        if mode == 'exact' or (mode == 'auto' and hits):
+            return sorted(hits)
+        if mode in ('prefix', 'auto'):
+            for manuscript_id in self._prefix_range(self.sorted_ids, query):
+                hits.update(self.by_id[manuscript_id])
+            for name in self._prefix_range(self.sorted_names, query):
+                hits.update(self.by_name[name])
+        if mode == 'partial' or (mode == 'auto' and not hits):
+            for manuscript_id in self.by_id:
+                if query in manuscript_id:
+                    hits.update(self.by_id[manuscript_id])
+        return sorted(hits)
+
+    def records(self, positions):
+        return [dict(zip(RESULT_COLUMNS, self.rows[i])) for i in positions]
+
+
+class ReviewIndex:
+    """
+    评审/复审表的持久化检索索引，保存在缓存目录中。
+    每次查询前检查源表修改时间和大小，变化时增量更新对应的表并写回磁盘。
+    更新和检索都在同一把锁内进行，并发请求不会读到更新到一半的索引。
+    """
+
+    def __init__(self, review_file, re_review_file):
+        self.files = {'review': review_file, 're_review': re_review_file}
+        key = hashlib.sha1(f"{os.path.abspath(review_file)}|{os.path.abspath(re_review_file)}".encode('utf-8'))
+        self.index_path = os.path.join(CACHE_DIR, f"review_index_{key.hexdigest()[:16]}.pkl")
+        self.sheets = self._load()
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            with open(self.index_path, 'rb') as f:
+                sheets = pickle.load(f)
+            # 旧版本保存的索引没有排序的姓名列表，需要重建
+            if set(sheets) == set(SHEETS) and all(hasattr(sheet, 'sorted_names') for sheet in sheets.values()):
+                return sheets
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError) as e:
+            if os.path.exists(self.index_path):
+                logging.warning(f"检索索引文件无法读取，重新构建: {self.index_path}, 错误: {e}")
+        return {name: _SheetIndex() for name in SHEETS}
+
+    def _save(self):
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(self.sheets, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.index_path)
+
+    def refresh(self):
+        """检查源表是否变化并更新索引；任一源表无法读取时返回 False"""
+        with self._lock:
+            changed = False
+            for name, path in self.files.items():
+                try:
+                    stat = os.stat(path)
+                except OSError as e:
+                    print(f"读取文件 {path} 时出错: {e}")
+                    return False
+                version = (stat.st_mtime, stat.st_size)
+                if self.sheets[name].version == version:
+                    continue
+                df = read_excel_cached(path)
+                if df is None:
+                    return False
+                added = self.sheets[name].update(df, version)
+                logging.info(f"检索索引已更新: {path}, 新增索引 {added} 行")
+                changed = True
+            if changed:
+                self._save()
+            return True
+
+    def search(self, query, mode='auto'):
+        """
+        按稿件编号或审稿人姓名检索。
+        mode: exact 精确匹配；prefix 追加前缀匹配；partial 追加稿件编号片段匹配；
+        auto 先精确匹配，无结果时依次尝试前缀和片段匹配。其他 mode 抛出 ValueError。
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"不支持的检索方式: {mode}")
+        if not self.refresh():
+            return {"error": "无法读取评审表或复审表文件"}
+        query = (query or '').strip()
+        if not query:
+            return {"review": [], "re_review": []}
+        with self._lock:
+            return {name: self.sheets[name].records(self.sheets[name].search(query, mode)) for name in SHEETS}
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_review_index(review_file, re_review_file):
+    """返回（并复用）指定评审/复审表对应的检索索引"""
+    with _indexes_lock:
+        key = (review_file, re_review_file)
+        if key not in _indexes:
+            _indexes[key] = ReviewIndex(review_file, re_review_file)
+        return _indexes[key]
@@ -0,0 +1,312 @@
+import os
+import json
+import time
+import uuid
+import queue
+import logging
+import threading
+from webpq import DB_NAME, scrape_and_process_data
+from article_db import connect
+
+logger = logging.getLogger(__name__)
+
+# 任务状态；后三种为结束状态
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+FINISHED_STATES = (JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED)
+
+HEARTBEAT_INTERVAL = 10  # 执行任务的进程每隔多少秒更新一次心跳
+STALE_AFTER = 60  # 心跳超过多少秒未更新的任务视为所属进程已退出
+
+# 文章进度的先后顺序，统计时按“已到达该阶段”计数；failed 单独计数
+ARTICLE_STAGES = ('found', 'fetched', 'downloaded', 'rendered')
+
+
+class JobNotCancellableError(RuntimeError):
+    """运行中的任务属于另一个进程，无法从当前进程取消"""
+
+
+class ScrapeJobRunner:
+    """
+    后台爬虫任务：提交后立即返回任务编号，任务由一个后台线程依次执行。
+    任务状态和每篇文章的进度保存在爬虫数据库的 scrape_jobs / scrape_job_articles 表中，服务重启后仍可查询。
+    未完成的任务记录所属进程和心跳；启动时只接管所属进程已退出或心跳超时的任务，
+    重新排队执行（爬取是增量的，已完成的文章不会重复获取）。
+    """
+
+    def __init__(self, db_path=DB_NAME, run=scrape_and_process_data):
+        self.db_path = db_path
+        self.run = run
+        self._condition = threading.Condition()
+        self._versions = {}        # 任务编号 -> 进度版本号，每次状态或进度变化递增
+        self._cancel_events = {}   # 任务编号 -> threading.Event
+        self._queue = queue.Queue()
+        self._worker = None
+        self._create_tables()
+
+    def _connect(self):
+        return connect(self.db_path)
+
+    def _create_tables(self):
+        conn = self._connect()
+        try:
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS scrape_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    year TEXT NOT NULL,
+                    issue TEXT NOT NULL,
+                    incremental INTEGER NOT NULL DEFAULT 1,
+                    status TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    result TEXT,
+                    error TEXT,
+                    owner_pid INTEGER,
+                    heartbeat REAL
+                );
+                CREATE TABLE IF NOT EXISTS scrape_job_articles (
+                    job_id TEXT NOT NULL,
+                    article_id TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    error TEXT,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (job_id, article_id)
+                );
+            ''')
+            # 旧版本建的表没有所属进程和心跳列
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(scrape_jobs)")}
+            for column, column_type in (('owner_pid', 'INTEGER'), ('heartbeat', 'REAL')):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE scrape_jobs ADD COLUMN {column} {column_type}")
+            conn.commit()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _owner_alive(pid, heartbeat, now):
+        """
+        任务的所属进程是否仍在运行。进程号会被重用（容器中重启后甚至与当前进程相同），
+        所以进程存在时还要求心跳未超时；记录的是当前进程号时，必定是上一次运行留下的任务。
+        """
+        if not pid or pid == os.getpid():
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except OSError:
+            pass  # 无权限或无法判断，由心跳决定
+        return heartbeat is not None and now - heartbeat < STALE_AFTER
+
+    def start(self):
+        """启动后台线程和心跳线程，并接管所属进程已退出的未完成任务"""
+        if self._worker is not None:
+            return
+        self._recover()
+        self._worker = threading.Thread(target=self._run_loop, name='scrape-jobs', daemon=True)
+        self._worker.start()
+        threading.Thread(target=self._heartbeat_loop, name='scrape-jobs-heartbeat', daemon=True).start()
+
+    def _recover(self):
+        now = time.time()
+        recovered = []
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT job_id, owner_pid, heartbeat FROM scrape_jobs WHERE status IN (?, ?) ORDER BY created_at",
+                                (JOB_QUEUED, JOB_RUNNING)).fetchall()
+            for row in rows:
+                if self._owner_alive(row['owner_pid'], row['heartbeat'], now):
+                    continue
+                # 条件更新：多个进程同时启动时只有一个能接管
+                cursor = conn.execute("""
+                    UPDATE scrape_jobs SET status = ?, started_at = NULL, owner_pid = ?, heartbeat = ?
+                    WHERE job_id = ? AND owner_pid IS ? AND heartbeat IS ?
+                """, (JOB_QUEUED, os.getpid(), now, row['job_id'], row['owner_pid'], row['heartbeat']))
+                if cursor.rowcount == 1:
+                    recovered.append(row['job_id'])
+            conn.commit()
+        finally:
+            conn.close()
+        for job_id in recovered:
+            logger.info(f"重新排队所属进程已退出的爬虫任务: {job_id}")
+            self._queue.put(job_id)
+
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            try:
+                conn = self._connect()
+                try:
+                    conn.execute("UPDATE scrape_jobs SET heartbeat = ? WHERE owner_pid = ? AND status IN (?, ?)",
+                                 (time.time(), os.getpid(), JOB_QUEUED, JOB_RUNNING))
+                    conn.commit()
+                finally:
+                    conn.close()
+            except Exception as e:
+                logger.error(f"更新爬虫任务心跳时出错: {e}")
+
+    def _touch(self, job_id):
+        with self._condition:
+            self._versions[job_id] = self._versions.get(job_id, 0) + 1
+            self._condition.notify_all()
+
+    def _update_job(self, job_id, **fields):
+        conn = self._connect()
+        try:
+            conn.execute(f"UPDATE scrape_jobs SET {', '.join(f'{name} = ?' for name in fields)} WHERE job_id = ?",
+                         (*fields.values(), job_id))
+            conn.commit()
+        finally:
+            conn.close()
+        self._touch(job_id)
+
+    def submit(self, year, issue, incremental=True):
+        """提交爬虫任务，返回任务编号"""
+        job_id = uuid.uuid4().hex[:12]
+        conn = self._connect()
+        try:
+            conn.execute("""
+                INSERT INTO scrape_jobs (job_id, year, issue, incremental, status, created_at, owner_pid, heartbeat)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (job_id, str(year), str(issue), int(bool(incremental)), JOB_QUEUED, time.time(), os.getpid(), time.time()))
+            conn.commit()
+        finally:
+            conn.close()
+        self._touch(job_id)
+        self._queue.put(job_id)
+        return job_id
+
+    def cancel(self, job_id):
+        """
+        取消任务：排队中的任务直接取消，运行中的任务不再开始新的文章。返回任务状态，任务不存在时返回 None。
+        运行中的任务属于另一个进程时抛出 JobNotCancellableError。
+        """
+        job = self.get(job_id, include_articles=False)
+        if job is None or job['status'] in FINISHED_STATES:
+            return job
+        conn = self._connect()
+        try:
+            cancelled = conn.execute("UPDATE scrape_jobs SET status = ?, finished_at = ? WHERE job_id = ? AND status = ?",
+                                     (JOB_CANCELLED, time.time(), job_id, JOB_QUEUED)).rowcount == 1
+            conn.commit()
+        finally:
+            conn.close()
+        if not cancelled:
+            event = self._cancel_events.get(job_id)
+            if event is None:
+                job = self.get(job_id, include_articles=False)
+                if job['status'] not in FINISHED_STATES:
+                    raise JobNotCancellableError(f"任务 {job_id} 由另一个进程执行，无法在此取消")
+                return job
+            event.set()
+        self._touch(job_id)
+        return self.get(job_id, include_articles=False)
+
+    def _progress(self, job_id, article_id, stage, error=None):
+        conn = self._connect()
+        try:
+            conn.execute("""
+                INSERT INTO scrape_job_articles (job_id, article_id, stage, error, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (job_id, article_id) DO UPDATE
+                SET stage = excluded.stage, error = excluded.error, updated_at = excluded.updated_at
+            """, (job_id, article_id, stage, error, time.time()))
+            conn.commit()
+        finally:
+            conn.close()
+        self._touch(job_id)
+
+    def _claim(self, job_id):
+        """把排队中的任务标记为运行中；任务已不在排队状态时返回 False"""
+        conn = self._connect()
+        try:
+            cursor = conn.execute("""
+                UPDATE scrape_jobs SET status = ?, started_at = ?, owner_pid = ?, heartbeat = ? WHERE job_id = ? AND status = ?
+            """, (JOB_RUNNING, time.time(), os.getpid(), time.time(), job_id, JOB_QUEUED))
+            conn.commit()
+            claimed = cursor.rowcount == 1
+        finally:
+            conn.close()
+        if claimed:
+            self._touch(job_id)
+        return claimed
+
+    def _run_loop(self):
+        while True:
+            job_id = self._queue.get()
+            event = threading.Event()
+            self._cancel_events[job_id] = event
+            if not self._claim(job_id):
+                # 排队期间已被取消
+                self._cancel_events.pop(job_id, None)
+                continue
+            job = self.get(job_id, include_articles=False)
+            logger.info(f"开始爬虫任务 {job_id}: {job['year']} 年 {job['issue']}")
+            try:
+                result = self.run(job['year'], job['issue'], incremental=job['incremental'],
+                                  progress=lambda article_id, stage, error=None: self._progress(job_id, article_id, stage, error),
+                                  cancel_event=event)
+                status = JOB_CANCELLED if event.is_set() else JOB_COMPLETED
+                self._update_job(job_id, status=status, finished_at=time.time(),
+                                 result=json.dumps(result, ensure_ascii=False, default=str))
+            except Exception as e:
+                logger.error(f"爬虫任务 {job_id} 失败: {e}")
+                self._update_job(job_id, status=JOB_FAILED, finished_at=time.time(), error=str(e))
+            finally:
+                self._cancel_events.pop(job_id, None)
+
+    def version(self, job_id):
+        with self._condition:
+            return self._versions.get(job_id, 0)
+
+    def wait(self, job_id, version, timeout=None):
+        """等待任务的进度版本号不再等于 version，超时返回 False"""
+        with self._condition:
+            return self._condition.wait_for(lambda: self._versions.get(job_id, 0) != version, timeout)
+
+    def get(self, job_id, include_articles=True):
+        """返回任务状态、各阶段文章数和（可选）每篇文章的进度；任务不存在时返回 None"""
+        # 先取版本号再读数据，按版本号等待更新时不会漏掉变化
+        version = self.version(job_id)
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM scrape_jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            articles = conn.execute("""
+                SELECT article_id, stage, error FROM scrape_job_articles WHERE job_id = ? ORDER BY rowid
+            """, (job_id,)).fetchall()
+        finally:
+            conn.close()
+
+        counts = {stage: 0 for stage in ARTICLE_STAGES}
+        counts['failed'] = 0
+        for article in articles:
+            if article['stage'] == 'failed':
+                counts['failed'] += 1
+                continue
+            for stage in ARTICLE_STAGES[:ARTICLE_STAGES.index(article['stage']) + 1]:
+                counts[stage] += 1
+
+        job = {
+            "job_id": row['job_id'],
+            "year": row['year'],
+            "issue": row['issue'],
+            "incremental": bool(row['incremental']),
+            "status": row['status'],
+            "cancel_requested": job_id in self._cancel_events and self._cancel_events[job_id].is_set(),
+            "created_at": row['created_at'],
+            "started_at": row['started_at'],
+            "finished_at": row['finished_at'],
+            "progress": counts,
+            "result": json.loads(row['result']) if row['result'] else None,
+            "error": row['error'],
+            "version": version
+        }
+        if include_articles:
+            job["articles"] = [dict(article) for article in articles]
+        return job
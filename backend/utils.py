@@ -1,5 +1,21 @@
+import os
+import re
+import hashlib
+import tempfile
+from contextlib import contextmanager
+from functools import lru_cache
+import numpy as np
 import pandas as pd
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# 判断校内人员的关键词，审稿人单位或地址中出现任一关键词即视为校内
+INTERNAL_KEYWORDS = ('江南大学', '蠡湖大道', '1800号')
+
 def read_excel(data):
     try:
         if data.endswith('.xlsx'):
@@ -12,9 +28,34 @@ def read_excel(data):
         print(f"读取文件 {data} 时出错: {e}")
         return None
 
-def is_internal(unit, address):
-    keywords = ['江南大学', '蠡湖大道', '1800号']
-    return any(keyword in str(unit) or keyword in str(address) for keyword in keywords)
+@lru_cache(maxsize=None)
+def _keyword_pattern(keywords):
+    if not keywords:
+        # 没有关键词时不匹配任何文本（空模式会匹配所有字符串）
+        return re.compile(r'(?!)')
+    return re.compile('|'.join(re.escape(keyword) for keyword in keywords))
+
+@lru_cache(maxsize=65536)
+def _contains_keyword(pattern, text):
+    return pattern.search(text) is not None
+
+def is_internal(unit, address, keywords=INTERNAL_KEYWORDS):
+    pattern = _keyword_pattern(tuple(keywords))
+    return _contains_keyword(pattern, str(unit)) or _contains_keyword(pattern, str(address))
+
+def _column_matches(values, pattern):
+    # 同一单位/地址在表中大量重复，只对不同的字符串做一次匹配
+    codes, uniques = pd.factorize(values.astype(str))
+    hits = np.fromiter((_contains_keyword(pattern, text) for text in uniques), dtype=bool, count=len(uniques))
+    return hits[codes]
+
+def classify_internal(df, unit_column='审稿人单位', address_column='审稿人地址', keywords=INTERNAL_KEYWORDS):
+    """
+    批量判断校内/校外，结果与逐行调用 is_internal 相同，返回布尔 Series
+    """
+    pattern = _keyword_pattern(tuple(keywords))
+    hits = _column_matches(df[unit_column], pattern) | _column_matches(df[address_column], pattern)
+    return pd.Series(hits, index=df.index)
 
 def match_employee_info(name, employee_df, retired_df):
     matches = employee_df[employee_df['姓名'] == name]
@@ -30,3 +71,38 @@ def match_employee_info(name, employee_df, retired_df):
         return matches.iloc[0]['工号'], matches.iloc[0]['部门'], False, 'active'
     else:
         return matches.iloc[0]['工号'], matches.iloc[0]['部门'], True, 'active'
+
+@contextmanager
+def file_lock(path):
+    """
+    对 path 加进程间独占锁，同一文件的写操作在多个进程间串行执行。
+    锁文件放在本机临时目录中、按绝对路径的哈希命名，不在数据文件旁边生成 .lock 文件
+    （数据目录可能是 OneDrive 等同步文件夹）。
+    """
+    key = hashlib.sha1(os.path.normcase(os.path.abspath(path)).encode('utf-8')).hexdigest()
+    lock_path = os.path.join(tempfile.gettempdir(), f"jiangnan_{key}.lock")
+    with open(lock_path, 'a+') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+def atomic_save_workbook(wb, path):
+    """先保存到同目录下的临时文件再替换目标文件，避免写到一半的文件被读取或同步"""
+    directory, filename = os.path.split(os.path.abspath(path))
+    tmp_path = os.path.join(directory, f".{filename}.tmp")
+    try:
+        wb.save(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -1,16 +1,21 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import HTTPError as URLLib3Error
 from bs4 import BeautifulSoup
-import sqlite3
 import os
 import json
 import re
 import time
 import logging
-from queue import Queue
+import threading
+from queue import Queue, Empty
 from urllib.parse import urljoin
+from concurrent.futures import ThreadPoolExecutor
 from multiprocessing import Process, Queue as MPQueue
 from pdf2image import convert_from_path
-import shutil
+from rate_limiter import HostRateLimiter
+from pdf_store import PdfStore
+from article_db import connect, migrate, ArticleWriter, WRITE_FLUSH_TIMEOUT
 
 # 设置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -22,9 +27,32 @@ BROWSER_ISSUE_URL = f"{BASE_URL}/spyswjs/issue/browser"
 DOWNLOAD_DIR = "downloads"
 PROCESSED_DIR = "processed"
 DB_NAME = "journal_articles.db"
+BASE_VOLUME_YEAR = 2023  # 卷数推算基准：2023 年为第 42 卷
+BASE_VOLUME = 42
 MAX_RETRIES = 3
-DELAY = 2  # 请求间隔增加到2秒
 DOWNLOAD_TIMEOUT = 60  # 下载超时时间设置为60秒（1分钟）
+PDF_MAGIC_WINDOW = 1024  # PDF 文件头 %PDF 须出现在前多少个字节内
+REQUEST_TIMEOUT = 30  # 页面请求超时时间
+FETCH_WORKERS = 4  # 同时获取文章详情和下载PDF的线程数
+REQUESTS_PER_SECOND = 2.0  # 每个主机的请求速率上限，出错或响应变慢时自动降低
+REQUEST_BURST = 4  # 每个主机允许的突发请求数
+SLOW_RESPONSE = 5  # 响应时间超过该秒数时视为服务器压力大，降低速率
+RETRY_STATUSES = (429, 500, 502, 503, 504)  # 需要重试的响应状态码
+BACKOFF_FACTOR = 1  # 下载重试的退避基数（秒），第 n 次重试前等待 BACKOFF_FACTOR * 2**n 秒
+MAX_BACKOFF = 60
+HTTP_GZIP = True  # 请求页面时接受 gzip 压缩
+USER_AGENT = "Mozilla/5.0 (compatible; jiangnan-journal-scraper)"
+PDF_STORE_MAX_BYTES = None  # PDF存储的大小上限（字节），超出时删除最久未用的PDF；None 表示全部保留
+RENDER_WORKERS = max(1, min(4, (os.cpu_count() or 2) // 2))  # 转换PDF首页的进程数
+RENDER_DPI = 150  # 首页图片分辨率
+RENDER_FORMAT = 'png'  # 首页图片格式：png 或 jpeg
+
+# 下载的PDF按内容保存在 DOWNLOAD_DIR 下，不同期数中相同的PDF只保存一份
+pdf_store = PdfStore(DOWNLOAD_DIR, DB_NAME, max_bytes=PDF_STORE_MAX_BYTES)
+article_writer = ArticleWriter(DB_NAME)  # 爬虫数据库的单写线程，文章记录、图片路径和页面缓存都由它批量写入
+
+# 按主机限速，所有线程共用
+host_limiter = HostRateLimiter(rate=REQUESTS_PER_SECOND, burst=REQUEST_BURST, slow_threshold=SLOW_RESPONSE)
 
 # 创建下载和处理目录
 for directory in [DOWNLOAD_DIR, PROCESSED_DIR]:
@@ -32,25 +60,102 @@ for directory in [DOWNLOAD_DIR, PROCESSED_DIR]:
         os.makedirs(directory)
 
 def get_db_connection():
-    """创建并返回一个新的数据库连接"""
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """创建并返回一个新的数据库连接（WAL 模式）"""
+    return connect(DB_NAME)
 
-def get_soup(url, retries=MAX_RETRIES):
-    """获取BeautifulSoup对象"""
-    for _ in range(retries):
+def create_session(pool_size=FETCH_WORKERS * 2, gzip=HTTP_GZIP):
+    """
+    创建爬虫共用的 HTTP 会话：保持连接（keep-alive）并复用连接池，避免每次请求重新握手。
+    重试不交给连接池，由 http_get 处理，这样每次重试都经过限速器。
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({
+        'User-Agent': USER_AGENT,
+        'Accept-Encoding': 'gzip, deflate' if gzip else 'identity',
+        'Connection': 'keep-alive',
+    })
+    return session
+
+# 所有线程共用的会话
+session = create_session()
+
+def backoff_delay(attempt):
+    return min(MAX_BACKOFF, BACKOFF_FACTOR * 2 ** attempt)
+
+def http_get(url, retries=MAX_RETRIES, **kwargs):
+    """
+    通过共用会话发送 GET 请求，默认超时 REQUEST_TIMEOUT。
+    每次请求前按主机限速；连接错误、超时和 RETRY_STATUSES 中的状态码最多重试 retries 次，
+    退避时间由限速器决定（按 Retry-After 或指数增长）。重试用尽时抛出异常或返回最后一次响应。
+    """
+    kwargs.setdefault('timeout', REQUEST_TIMEOUT)
+    for attempt in range(retries + 1):
+        host_limiter.acquire(url)
+        start = time.monotonic()
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            return BeautifulSoup(response.text, 'html.parser')
-        except requests.RequestException as e:
-            logger.error(f"请求失败: {url}, 错误: {e}")
-            time.sleep(DELAY)
+            response = session.get(url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            host_limiter.record(url, error=True)
+            if attempt == retries:
+                raise
+            logger.warning(f"请求失败，稍后重试: {url}, 错误: {e}")
+            continue
+        host_limiter.record(url, status=response.status_code, elapsed=time.monotonic() - start,
+                            retry_after=response.headers.get('Retry-After'))
+        if response.status_code in RETRY_STATUSES and attempt < retries:
+            logger.warning(f"请求返回 {response.status_code}，稍后重试: {url}")
+            response.close()
+            continue
+        return response
+
+def load_page_cache(url):
+    conn = get_db_connection()
+    try:
+        return conn.execute("SELECT etag, last_modified, body FROM page_cache WHERE url = ?", (url,)).fetchone()
+    finally:
+        conn.close()
+
+def save_page_cache(url, etag, last_modified, body):
+    article_writer.execute("""
+        INSERT OR REPLACE INTO page_cache (url, etag, last_modified, body, fetched_at)
+        VALUES (?, ?, ?, ?, ?)
+    """, (url, etag, last_modified, body, time.time()))
+
+def fetch_page(url, conditional=True, retries=MAX_RETRIES):
+    """
+    获取页面文本。conditional 为 True 时带上次保存的 ETag/Last-Modified 发送条件请求，
+    服务器返回 304 时直接使用缓存的页面；服务器提供了 ETag 或 Last-Modified 的页面会被缓存。
+    """
+    cached = load_page_cache(url) if conditional else None
+    headers = {}
+    if cached is not None:
+        if cached['etag']:
+            headers['If-None-Match'] = cached['etag']
+        if cached['last_modified']:
+            headers['If-Modified-Since'] = cached['last_modified']
+    response = http_get(url, retries=retries, headers=headers)
+    if response.status_code == 304 and cached is not None:
+        logger.info(f"页面未变化，使用缓存: {url}")
+        return cached['body']
+    response.raise_for_status()
+    etag, last_modified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+    if etag or last_modified:
+        save_page_cache(url, etag, last_modified, response.text)
+    return response.text
+
+def get_soup(url, retries=MAX_RETRIES, conditional=True):
+    """获取BeautifulSoup对象"""
+    try:
+        return BeautifulSoup(fetch_page(url, conditional=conditional, retries=retries), 'html.parser')
+    except requests.RequestException as e:
+        logger.error(f"请求失败: {url}, 错误: {e}")
     return None
 
-def get_years_and_issues():
-    """获取所有年份和期数信息"""
+def get_years_and_issues(years=None):
+    """获取所有年份和期数信息，返回 {年份: [期数, ...]}；years 不为空时只返回其中的年份"""
     soup = get_soup(BROWSER_ISSUE_URL)
     if not soup:
         return {}
@@ -71,13 +176,14 @@ def get_years_and_issues():
         # 解析 JSON 数据
         json_data = json_str.group(1).replace('\\', '')
         data = json.loads(json_data)
+        wanted = {str(year) for year in years} if years else None
         years_issues = {}
         for year in data['years']:
-            if year['year_id'] == '2023':
-                years_issues['2023'] = [issue['cn_name'] for issue in year['issues']]
-                break
+            year_id = str(year['year_id'])
+            if wanted is None or year_id in wanted:
+                years_issues[year_id] = [issue['cn_name'] for issue in year['issues']]
 
-        logger.info(f"获取到的2023年期数信息: {years_issues}")
+        logger.info(f"获取到的期数信息: {years_issues}")
         return years_issues
     except json.JSONDecodeError as e:
         logger.error(f"JSON 解析错误: {e}")
@@ -86,19 +192,27 @@ def get_years_and_issues():
         logger.error(f"JSON 结构不符合预期: {e}")
         return {}
 
-def get_article_details(article_id):
+def issue_url(year, issue):
+    """期数页面地址；卷数按 2023 年为第 42 卷推算"""
+    volume = BASE_VOLUME - (BASE_VOLUME_YEAR - int(year))
+    # 从issue中提取数字
+    issue_number = ''.join(filter(str.isdigit, issue))
+    return f"{BASE_URL}/spyswjs/article/issue/{year}_{volume}_{issue_number}"
+
+def get_article_details(article_id, conditional=True):
     """获取文章详细信息"""
     url = f"{BASE_URL}/spyswjs/article/abstract/{article_id}?st=article_issue"
     logger.info(f"正在获取文章详情: {url}")
-    response = requests.get(url)
-    if response.status_code != 200:
-        logger.error(f"无法获取文章详情页面: {url}, 状态码: {response.status_code}")
+    try:
+        page = fetch_page(url, conditional=conditional)
+    except requests.RequestException as e:
+        logger.error(f"无法获取文章详情页面: {url}, 错误: {e}")
         return None
 
     logger.info(f"成功获取文章详情页面: {url}")
     
     # 查找包含作者信息的JavaScript变量
-    author_json_match = re.search(r'var strAuthorsJson\s*=\s*"(.+?)";', response.text)
+    author_json_match = re.search(r'var strAuthorsJson\s*=\s*"(.+?)";', page)
     if author_json_match:
         logger.info("找到作者信息JSON")
         # 提取JSON字符串但不解码
@@ -141,172 +255,340 @@ def get_article_details(article_id):
     
     return None
 
-def get_articles(year, issue, pdf_queue):
-    """获取指定年份和期数的文章信息并下载PDF"""
-    # 计算卷数
-    volume = 42 - (2023 - int(year))
-    # 从issue中提取数字
-    issue_number = ''.join(filter(str.isdigit, issue))
-    
-    url = f"{BASE_URL}/spyswjs/article/issue/{year}_{volume}_{issue_number}"
+def parse_issue_page(year, issue, conditional=True):
+    """获取期数页面并解析文章列表，返回 [(标题, PDF链接, 稿件编号), ...]；页面获取失败时返回 None"""
+    url = issue_url(year, issue)
     logger.info(f"正在获取文章信息: {url}")
-    soup = get_soup(url)
+    soup = get_soup(url, conditional=conditional)
     if not soup:
         logger.error(f"无法获取页面内容: {url}")
-        return []
+        return None
 
-    articles = []
     article_list = soup.find('div', class_='article_list')
-    if article_list:
-        logger.info(f"找到文章列表元素")
-        conn = get_db_connection()
-        try:
-            cursor = conn.cursor()
-            for article in article_list.find_all('li', class_='article_line'):
-                title_elem = article.find('div', class_='article_title')
-                pdf_elem = article.find('a', class_='btn_pdf')
-                if title_elem and pdf_elem:
-                    title = title_elem.text.strip()
-                    pdf_link = urljoin(BASE_URL, pdf_elem['href'])
-                    
-                    # 提取稿件编号
-                    article_id = title_elem.find('a')['href'].split('/')[-1].split('?')[0]
-                    
-                    # 获取文章详细信息
-                    article_details = get_article_details(article_id)
-                    
-                    logger.info(f"找到文章: {title}, 稿件编号: {article_id}")
-                    
-                    # 下载PDF
-                    local_path = download_pdf(pdf_link, title, pdf_queue)
-                    if local_path:
-                        if article_details:
-                            article_info = {
-                                "title": title,
-                                "pdf_link": pdf_link,
-                                "local_path": local_path,
-                                "article_id": article_id,
-                                "author_name": article_details['author_name'],
-                                "is_internal": article_details['is_internal'],
-                                "all_authors": article_details['all_authors']
-                            }
-                            articles.append(article_info)
-                            logger.info(f"成功下载PDF: {local_path}")
-                            
-                            # 将PDF信息添加到队列中
-                            pdf_queue.put((local_path, article_details['is_internal'], article_id, title))
-                            
-                            try:
-                                cursor.execute("""
-                                    INSERT OR REPLACE INTO articles 
-                                    (title, pdf_link, local_path, year, issue, article_id, author_name, is_internal) 
-                                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                                """, (title, pdf_link, local_path, year, issue, article_id, 
-                                      article_info['author_name'], article_info['is_internal']))
-                                conn.commit()
-                                logger.info(f"成功将文章信息插入数据库: {title}")
-                            except Exception as e:
-                                logger.error(f"插入数据库时出错: {e}")
-                        else:
-                            logger.warning(f"未找到作者信息: {title}")
-                    else:
-                        logger.warning(f"无法下载PDF: {title}")
-                    
-                    time.sleep(DELAY)  # 每下载一篇文章后等待
-                else:
-                    logger.warning(f"文章元素不完整: title_elem={bool(title_elem)}, pdf_elem={bool(pdf_elem)}")
-        except Exception as e:
-            logger.error(f"处理文章列表时出错: {e}")
-        finally:
-            conn.close()
-    else:
+    if not article_list:
         logger.warning("未找到文章列表元素")
-    
+        return []
+    logger.info(f"找到文章列表元素")
+
+    entries = []
+    for article in article_list.find_all('li', class_='article_line'):
+        title_elem = article.find('div', class_='article_title')
+        pdf_elem = article.find('a', class_='btn_pdf')
+        if title_elem and pdf_elem:
+            title = title_elem.text.strip()
+            pdf_link = urljoin(BASE_URL, pdf_elem['href'])
+            # 提取稿件编号
+            article_id = title_elem.find('a')['href'].split('/')[-1].split('?')[0]
+            logger.info(f"找到文章: {title}, 稿件编号: {article_id}")
+            entries.append((title, pdf_link, article_id))
+        else:
+            logger.warning(f"文章元素不完整: title_elem={bool(title_elem)}, pdf_elem={bool(pdf_elem)}")
+    return entries
+
+def save_article(article_info, year, issue, on_commit=None):
+    """通过单写线程写入（或覆盖）一篇文章的记录，on_commit 见 ArticleWriter"""
+    article_writer.execute("""
+        INSERT OR REPLACE INTO articles 
+        (title, pdf_link, local_path, year, issue, article_id, author_name, is_internal) 
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, (article_info['title'], article_info['pdf_link'], article_info['local_path'], year, issue,
+          article_info['article_id'], article_info['author_name'], article_info['is_internal']),
+        on_commit=on_commit)
+
+def save_image_path(article_id, image_path, pdf_path, on_commit=None):
+    """
+    通过单写线程把文章的本地路径更新为转换后的图片；提交后删除原PDF
+    （PDF存储中的文件由存储按大小上限管理，不在这里删除）
+    """
+    def committed(error):
+        if error is None and not pdf_store.contains(pdf_path) and os.path.exists(pdf_path):
+            os.remove(pdf_path)
+            logger.info(f"已删除原PDF文件: {pdf_path}")
+        if on_commit is not None:
+            on_commit(error)
+
+    # 文章记录不存在（例如写入失败）时更新不到任何行，按失败回调，不会误报转换完成
+    article_writer.execute("UPDATE articles SET local_path = ? WHERE article_id = ?", (image_path, article_id),
+                           on_commit=committed, require_rows=True)
+
+def report_progress(progress, article_id, stage, error=None):
+    """调用进度回调 progress(稿件编号, 阶段, 错误信息)，回调出错不影响爬取"""
+    if progress is None:
+        return
+    try:
+        progress(article_id, stage, error)
+    except Exception as e:
+        logger.error(f"进度回调出错: {e}")
+
+def get_articles(year, issue, pdf_queue, incremental=True, progress=None, cancel_event=None):
+    """
+    获取指定年份和期数的文章信息并下载PDF。
+    incremental 为 True 时发送条件请求，数据库中已有完整记录（且图片或PDF仍在）的文章不再获取详情和下载。
+    progress 为进度回调，每篇文章依次报告 found/fetched/downloaded（转换完成后由调用方报告 rendered），
+    失败时报告 failed；cancel_event 被设置后不再开始新的文章。
+    """
+    entries = parse_issue_page(year, issue, conditional=incremental) or []
+    for _, _, article_id in entries:
+        report_progress(progress, article_id, 'found')
+
+    articles = []
+    if incremental:
+        known = load_known_articles([article_id for _, _, article_id in entries])
+        pending = []
+        for entry in entries:
+            article_info = known.get(entry[2])
+            if article_info is None:
+                pending.append(entry)
+                continue
+            articles.append(article_info)
+            if article_info['local_path'].lower().endswith('.pdf'):
+                # 已下载但尚未转换为图片，只需重新放入处理队列
+                report_progress(progress, article_info['article_id'], 'downloaded')
+                pdf_queue.put((article_info['local_path'], article_info['is_internal'],
+                               article_info['article_id'], article_info['title']))
+            else:
+                report_progress(progress, article_info['article_id'], 'rendered')
+        logger.info(f"数据库中已有 {len(articles)} 篇文章，需要获取 {len(pending)} 篇")
+        entries = pending
+
+    # 详情页和PDF在线程池中并发获取（由 host_limiter 控制请求速率），结果按文章顺序交给单写线程批量写入
+    try:
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+            for article_info in executor.map(lambda entry: fetch_article(entry, incremental, progress, cancel_event), entries):
+                if article_info is None:
+                    continue
+                articles.append(article_info)
+
+                # 先提交写入再放入处理队列：单写线程按顺序执行，图片路径的更新不会被文章记录覆盖
+                save_article(article_info, year, issue)
+                pdf_queue.put((article_info['local_path'], article_info['is_internal'],
+                               article_info['article_id'], article_info['title']))
+    except Exception as e:
+        logger.error(f"处理文章列表时出错: {e}")
+
     logger.info(f"总共找到并下载了 {len(articles)} 篇文章")
     return articles
 
+def load_known_articles(article_ids):
+    """
+    查询数据库中已有完整记录的文章：作者信息已获取，且 local_path 指向的图片或PDF仍然存在。
+    返回 {稿件编号: 文章信息}
+    """
+    if not article_ids:
+        return {}
+    conn = get_db_connection()
+    try:
+        rows = conn.execute(f"""
+            SELECT title, pdf_link, local_path, article_id, author_name, is_internal FROM articles
+            WHERE article_id IN ({', '.join('?' * len(article_ids))}) AND author_name IS NOT NULL
+        """, article_ids).fetchall()
+    finally:
+        conn.close()
+    return {
+        row['article_id']: {
+            "title": row['title'],
+            "pdf_link": row['pdf_link'],
+            "local_path": row['local_path'],
+            "article_id": row['article_id'],
+            "author_name": row['author_name'],
+            "is_internal": bool(row['is_internal']),
+            "all_authors": None,
+            "cached": True
+        }
+        for row in rows if row['local_path'] and os.path.exists(row['local_path'])
+    }
+
+def fetch_article(entry, conditional=True, progress=None, cancel_event=None):
+    """获取一篇文章的详情并下载PDF（在线程池中执行），失败或任务已取消时返回 None"""
+    title, pdf_link, article_id = entry
+    if cancel_event is not None and cancel_event.is_set():
+        return None
+    try:
+        article_details = get_article_details(article_id, conditional=conditional)
+        if not article_details:
+            logger.warning(f"未找到作者信息: {title}")
+            report_progress(progress, article_id, 'failed', "未找到作者信息")
+            return None
+        report_progress(progress, article_id, 'fetched')
+        local_path = download_pdf(pdf_link, title, article_id=article_id)
+        if not local_path:
+            logger.warning(f"无法下载PDF: {title}")
+            report_progress(progress, article_id, 'failed', "无法下载PDF")
+            return None
+        logger.info(f"成功下载PDF: {local_path}")
+        report_progress(progress, article_id, 'downloaded')
+        return {
+            "title": title,
+            "pdf_link": pdf_link,
+            "local_path": local_path,
+            "article_id": article_id,
+            "author_name": article_details['author_name'],
+            "is_internal": article_details['is_internal'],
+            "all_authors": article_details['all_authors']
+        }
+    except Exception as e:
+        logger.error(f"获取文章时出错: {title}, 错误: {e}")
+        report_progress(progress, article_id, 'failed', str(e))
+        return None
+
 def sanitize_filename(filename):
     """处理文件名中的非法字符"""
     return re.sub(r'[\\/*?:"<>|]', "", filename)
 
-def process_pdf(pdf_queue, year, issue):
-    """处理PDF文件，只保留第一页并转换为PNG，然后移动到对应的年份和期数文件夹"""
-    issue_dir = os.path.join(PROCESSED_DIR, f"{year}_{issue}")
-    if not os.path.exists(issue_dir):
-        os.makedirs(issue_dir)
+def render_first_page(pdf_path, output_dir, name, dpi=RENDER_DPI, fmt=RENDER_FORMAT):
+    """把PDF第一页直接渲染为 output_dir 下的 name.png（或 .jpg），返回图片路径"""
+    paths = convert_from_path(pdf_path, dpi=dpi, fmt=fmt, first_page=1, last_page=1,
+                              output_folder=output_dir, output_file=name, single_file=True, paths_only=True)
+    return paths[0] if paths else None
 
-    conn = get_db_connection()
+def process_pdf(pdf_queue, year, issue, result_queue, dpi=RENDER_DPI, fmt=RENDER_FORMAT):
+    """
+    处理进程：从队列取PDF，只把第一页渲染为图片，直接写入对应的年份和期数文件夹。
+    队列元素为 (PDF路径, 是否校内, 稿件编号, 标题)，可在末尾附加 (年份, 期数) 覆盖进程默认的期数。
+    处理进程不写数据库：每个文件的处理结果和耗时放入 result_queue，进程结束时放入 None，
+    由主进程的 collect_render_results 通过单写线程更新图片路径。
+    """
     try:
-        cursor = conn.cursor()
         while True:
             pdf_info = pdf_queue.get()
             if pdf_info is None:
                 break
-            
+
             # 修复：确保 pdf_info 包含正确数量的元素
-            if len(pdf_info) != 4:
+            if len(pdf_info) not in (4, 5):
                 logger.error(f"无效的 PDF 信息: {pdf_info}")
                 continue
-            
-            pdf_path, is_internal, article_id, title = pdf_info
-            
+
+            pdf_path, is_internal, article_id, title = pdf_info[:4]
+            item_year, item_issue = pdf_info[4] if len(pdf_info) == 5 else (year, issue)
+            issue_dir = os.path.join(PROCESSED_DIR, f"{item_year}_{item_issue}")
+            start = time.monotonic()
+            image_path, error = None, None
             try:
-                # 转换PDF第一页为PNG
+                os.makedirs(issue_dir, exist_ok=True)
                 internal_status = "校内" if is_internal else "校外"
-                sanitized_title = sanitize_filename(title)
-                png_filename = f"{internal_status}_{article_id}_{sanitized_title}.png"
-                temp_png_path = os.path.join(PROCESSED_DIR, png_filename)
-                images = convert_from_path(pdf_path, first_page=1, last_page=1)
-                if images:
-                    images[0].save(temp_png_path, 'PNG')
-                    
-                    # 移动PNG文件到对应的年份和期数文件夹
-                    final_png_path = os.path.join(issue_dir, png_filename)
-                    shutil.move(temp_png_path, final_png_path)
-                    
-                    logger.info(f"已处理PDF并保存为PNG: {final_png_path}")
-                    
-                    # 更新数据库中的本地路径
-                    cursor.execute("""
-                        UPDATE articles 
-                        SET local_path = ? 
-                        WHERE article_id = ?
-                    """, (final_png_path, article_id))
-                    conn.commit()
-                    
-                    # 删除原PDF文件
-                    os.remove(pdf_path)
-                    logger.info(f"已删除原PDF文件: {pdf_path}")
+                name = f"{internal_status}_{article_id}_{sanitize_filename(title)}"
+                image_path = render_first_page(pdf_path, issue_dir, name, dpi=dpi, fmt=fmt)
+                if image_path:
+                    logger.info(f"已处理PDF并保存为图片: {image_path}")
                 else:
+                    error = "无法处理PDF"
                     logger.warning(f"无法处理PDF: {pdf_path}")
             except Exception as e:
+                error = str(e)
                 logger.error(f"处理PDF时出错: {pdf_path}, 错误: {e}")
+
+            result_queue.put({
+                "article_id": article_id,
+                "pdf": pdf_path,
+                "image": image_path,
+                "seconds": round(time.monotonic() - start, 3),
+                "error": error
+            })
     finally:
-        conn.close()
+        result_queue.put(None)
 
-def download_pdf(url, filename, pdf_queue, retries=MAX_RETRIES):
-    """下载PDF文件"""
-    sanitized_filename = sanitize_filename(filename)
-    local_path = os.path.join(DOWNLOAD_DIR, f"{sanitized_filename}.pdf")
-    
-    if os.path.exists(local_path):
+def collect_render_results(result_queue, processes, progress=None):
+    """
+    收集各处理进程的结果，直到所有进程结束。转换成功的图片路径交给单写线程写入数据库，
+    写入提交后向 progress 报告 rendered；转换或写入失败时报告 failed。
+    """
+    results = []
+    finished = 0
+    while finished < len(processes):
+        try:
+            item = result_queue.get(timeout=1)
+        except Empty:
+            # 进程异常退出时不会放入结束标记
+            if not any(process.is_alive() for process in processes):
+                break
+            continue
+        if item is None:
+            finished += 1
+        else:
+            results.append(item)
+            if item['error']:
+                report_progress(progress, item['article_id'], 'failed', item['error'])
+                continue
+            save_image_path(item['article_id'], item['image'], item['pdf'],
+                            on_commit=lambda error, article_id=item['article_id']:
+                                report_progress(progress, article_id, 'failed' if error else 'rendered', error))
+    return results
+
+def download_pdf(url, filename, article_id=None, retries=MAX_RETRIES):
+    """
+    下载PDF文件到PDF存储，返回本地路径（由调用方放入处理队列）。
+    存储中已有该稿件的PDF时不再下载；中断的下载保留在 partial 文件中，重试或下次运行时用 Range 请求续传。
+    续传时带上开始下载时记录的 ETag/Last-Modified（If-Range），服务器上的文件已变化时会返回完整文件，
+    此时从头重写；没有校验信息或返回的范围与本地文件不衔接时也从头下载，避免拼出损坏的PDF。
+    下载时要求不压缩并按原始字节写入，续传的偏移与服务器上的字节一致；内容不是PDF（如错误页面）时不保存。
+    """
+    key = article_id or sanitize_filename(filename)
+    local_path = pdf_store.lookup(key)
+    if local_path:
         logger.info(f"文件已存在，跳过下载: {local_path}")
-        pdf_queue.put(local_path)
         return local_path
 
-    for _ in range(retries):
+    partial_path = pdf_store.partial_path(key)
+    for attempt in range(retries):
         try:
-            response = requests.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT)
-            response.raise_for_status()
-            with open(local_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+            offset = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+            validator = pdf_store.partial_validator(key) if offset else None
+            # 弱 ETag 不能用于 If-Range，改用 Last-Modified
+            if_range = None
+            if validator:
+                etag = validator.get('etag')
+                if_range = etag if etag and not etag.startswith('W/') else validator.get('last_modified')
+            if offset and not if_range:
+                logger.info(f"未完成的下载没有校验信息，从头下载: {url}")
+                pdf_store.discard_partial(key)
+                offset = 0
+            headers = {'Accept-Encoding': 'identity'}
+            if offset:
+                headers.update({'Range': f'bytes={offset}-', 'If-Range': if_range})
+            # 传输中断也需要重试，所以重试放在这里而不是 http_get 中
+            with http_get(url, retries=0, stream=True, timeout=DOWNLOAD_TIMEOUT, headers=headers) as response:
+                if response.status_code == 416:
+                    # 服务器不接受续传的范围，从头下载
+                    pdf_store.discard_partial(key)
+                    raise requests.HTTPError(f"续传范围无效: {url}", response=response)
+                response.raise_for_status()
+                resumed = response.status_code == 206
+                # 服务器仍然压缩时本地文件的大小与服务器上的字节数不对应，只能整体下载、不能续传
+                encoded = response.headers.get('Content-Encoding', 'identity').lower() != 'identity'
+                if encoded and resumed:
+                    pdf_store.discard_partial(key)
+                    raise requests.HTTPError(f"续传返回了压缩的内容，从头下载: {url}", response=response)
+                if resumed:
+                    match = re.match(r'bytes\s+(\d+)-', response.headers.get('Content-Range', ''))
+                    if not offset or match is None or int(match.group(1)) != offset:
+                        pdf_store.discard_partial(key)
+                        raise requests.HTTPError(f"续传返回的范围与本地文件不衔接: {url}, "
+                                                 f"Content-Range: {response.headers.get('Content-Range')}", response=response)
+                    logger.info(f"从 {offset} 字节处继续下载: {url}")
+                else:
+                    if offset:
+                        logger.info(f"服务器上的文件已变化或不支持续传，从头下载: {url}")
+                    if encoded:
+                        pdf_store.save_partial_validator(key)
+                    else:
+                        pdf_store.save_partial_validator(key, response.headers.get('ETag'),
+                                                         response.headers.get('Last-Modified'))
+                chunks = (response.iter_content(chunk_size=8192) if encoded
+                          else response.raw.stream(8192, decode_content=False))
+                with open(partial_path, 'ab' if resumed else 'wb') as f:
+                    for chunk in chunks:
+                        f.write(chunk)
+            with open(partial_path, 'rb') as f:
+                if b'%PDF' not in f.read(PDF_MAGIC_WINDOW):
+                    pdf_store.discard_partial(key)
+                    raise requests.RequestException(f"下载的内容不是PDF文件: {url}")
+            local_path = pdf_store.commit_partial(key, url)
             logger.info(f"下载成功: {local_path}")
-            pdf_queue.put(local_path)
             return local_path
-        except requests.RequestException as e:
+        except (requests.RequestException, URLLib3Error) as e:
             logger.error(f"下载失败: {url}, 错误: {e}")
-            time.sleep(DELAY)
+            time.sleep(backoff_delay(attempt))
     
     return None
 
@@ -324,18 +606,46 @@ def worker(queue):
             conn.commit()
         queue.task_done()
 
-def scrape_and_process_data(year, issue):
+def scrape_and_process_data(year, issue, incremental=True, render_workers=RENDER_WORKERS,
+                            dpi=RENDER_DPI, fmt=RENDER_FORMAT, progress=None, cancel_event=None):
+    """
+    爬取并处理指定期数；incremental 为 False 时忽略已有记录和页面缓存，全部重新获取。
+    render_workers 个处理进程共用一个队列转换PDF首页，结果中包含每个文件的转换耗时。
+    progress/cancel_event 见 get_articles；取消后已下载的PDF仍会转换完，结果中 cancelled 为 True。
+    """
     logger.info(f"开始爬取和处理 {year} 年 {issue} 的数据")
+    create_table()
     
     pdf_queue = MPQueue()
-    pdf_process = Process(target=process_pdf, args=(pdf_queue, year, issue))
-    pdf_process.start()
+    result_queue = MPQueue()
+    render_processes = [
+        Process(target=process_pdf, args=(pdf_queue, year, issue, result_queue, dpi, fmt))
+        for _ in range(max(1, render_workers))
+    ]
+    for process in render_processes:
+        process.start()
     
-    articles = get_articles(year, issue, pdf_queue)
+    # 转换结果在爬取过程中实时收集，便于报告进度
+    render_timings = []
+    collector = threading.Thread(
+        target=lambda: render_timings.extend(collect_render_results(result_queue, render_processes, progress)),
+        daemon=True
+    )
+    collector.start()
     
-    # 等待所有PDF处理完成
-    pdf_queue.put(None)
-    pdf_process.join()
+    articles = get_articles(year, issue, pdf_queue, incremental=incremental,
+                            progress=progress, cancel_event=cancel_event)
+    
+    # 等待所有PDF处理完成（每个处理进程一个结束标记）
+    for _ in render_processes:
+        pdf_queue.put(None)
+    collector.join()
+    for process in render_processes:
+        process.join()
+    if not article_writer.flush(timeout=WRITE_FLUSH_TIMEOUT):
+        logger.error(f"等待数据库写入超时（{WRITE_FLUSH_TIMEOUT} 秒），部分记录可能尚未保存")
+    for timing in render_timings:
+        logger.info(f"转换耗时 {timing['seconds']:.2f} 秒: {timing['pdf']}")
     
     conn = get_db_connection()
     try:
@@ -347,7 +657,10 @@ def scrape_and_process_data(year, issue):
             "year": year,
             "issue": issue,
             "articles_count": len(articles),
-            "processed_articles": [{"title": row['title'], "image_path": row['local_path']} for row in processed_articles]
+            "processed_articles": [{"title": row['title'], "image_path": row['local_path']} for row in processed_articles],
+            "render_timings": render_timings,
+            "render_seconds": round(sum(timing['seconds'] for timing in render_timings), 3),
+            "cancelled": bool(cancel_event is not None and cancel_event.is_set())
         }
     except Exception as e:
         logger.error(f"查询处理后的文章时出错: {e}")
@@ -359,26 +672,11 @@ def scrape_and_process_data(year, issue):
     return result
 
 def create_table():
-    conn = get_db_connection()
+    """建表并执行数据库迁移（表结构和索引见 article_db.MIGRATIONS）"""
     try:
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS articles (
-                title TEXT,
-                pdf_link TEXT,
-                local_path TEXT,
-                year TEXT,
-                issue TEXT,
-                article_id TEXT PRIMARY KEY,
-                author_name TEXT,
-                is_internal INTEGER
-            )
-        ''')
-        conn.commit()
+        migrate(DB_NAME)
     except Exception as e:
         logger.error(f"创建表时出错: {e}")
-    finally:
-        conn.close()
 
 def main():
     create_table()  # 添加这行
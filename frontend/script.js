@@ -397,15 +397,20 @@ function loadTasks() {
     renderTasks();
 }
 
+let pageFeeFilter = 'all';
+let pageFeeChangeSource = null;
+
 async function loadPageFeeData(filter = 'all') {
     try {
         console.log('开始加载版面费数据');
+        pageFeeFilter = filter;
         const response = await fetch(`/get_page_fee_data?filter=${filter}`);
         console.log('收到服务器响应:', response.status);
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
         const data = await response.json();
+        subscribePageFeeChanges(response.headers.get('X-Change-Version'));
         console.log('解析到的数据:', data);
         if (Array.isArray(data) && data.length === 0) {
             console.log('数据为空数组');
@@ -428,6 +433,8 @@ function displayPageFeeData(data) {
             <select id="filter-select">
                 <option value="all">全部</option>
                 <option value="unprocessed">未处理</option>
+                <option value="accepted_only">仅录用</option>
+                <option value="invoiced_only">仅发票</option>
             </select>
         </div>
         <div class="table-container">
@@ -445,21 +452,7 @@ function displayPageFeeData(data) {
                     </tr>
                 </thead>
                 <tbody>
-                    ${data.map(item => `
-                        <tr>
-                            <td>
-                                <input type="checkbox" class="status-checkbox" data-type="录用" data-manuscript="${item.稿件编号}" ${item.录用 ? 'checked' : ''}>
-                                <input type="checkbox" class="status-checkbox" data-type="发票" data-manuscript="${item.稿件编号}" ${item.发票 ? 'checked' : ''}>
-                            </td>
-                            <td class="manuscript-number" title="${item.稿件编号}">${item.稿件编号}</td>
-                            <td>${item.备注 || ''}</td>
-                            <td>${item.核销号 || ''}</td>
-                            <td>${item.财务备注 || ''}</td>
-                            <td>${item.税号 || ''}</td>
-                            <td>${item.发票抬头 || ''}</td>
-                            <td>${item.邮箱 || ''}</td>
-                        </tr>
-                    `).join('')}
+                    ${data.map(item => `<tr data-manuscript="${item.稿件编号}">${pageFeeRowCells(item)}</tr>`).join('')}
                 </tbody>
             </table>
         </div>
@@ -471,7 +464,57 @@ function displayPageFeeData(data) {
     });
 
     // 添加筛选变更事件监听器
-    document.getElementById('filter-select').addEventListener('change', handleFilterChange);
+    const filterSelect = document.getElementById('filter-select');
+    filterSelect.value = pageFeeFilter;
+    filterSelect.addEventListener('change', handleFilterChange);
+}
+
+function pageFeeRowCells(item) {
+    return `
+        <td>
+            <input type="checkbox" class="status-checkbox" data-type="录用" data-manuscript="${item.稿件编号}" ${item.录用 ? 'checked' : ''}>
+            <input type="checkbox" class="status-checkbox" data-type="发票" data-manuscript="${item.稿件编号}" ${item.发票 ? 'checked' : ''}>
+        </td>
+        <td class="manuscript-number" title="${item.稿件编号}">${item.稿件编号}</td>
+        <td>${item.备注 || ''}</td>
+        <td>${item.核销号 || ''}</td>
+        <td>${item.财务备注 || ''}</td>
+        <td>${item.税号 || ''}</td>
+        <td>${item.发票抬头 || ''}</td>
+        <td>${item.邮箱 || ''}</td>
+    `;
+}
+
+// 订阅服务端推送的修改，只更新变化的行；服务端要求全量刷新时重新加载
+function subscribePageFeeChanges(version) {
+    if (pageFeeChangeSource) {
+        pageFeeChangeSource.close();
+        pageFeeChangeSource = null;
+    }
+    if (!version || typeof EventSource === 'undefined') {
+        return;
+    }
+    pageFeeChangeSource = new EventSource(`/page_fee_changes/stream?since=${version}`);
+    pageFeeChangeSource.addEventListener('changes', event => {
+        const changes = JSON.parse(event.data);
+        // 有筛选条件时修改后的记录可能不再（或开始）符合条件，重新加载当前筛选结果
+        if (changes.reset || (pageFeeFilter !== 'all' && changes.records.length > 0)) {
+            loadPageFeeData(pageFeeFilter);
+            return;
+        }
+        changes.records.forEach(patchPageFeeRow);
+    });
+}
+
+function patchPageFeeRow(item) {
+    const row = document.querySelector(`#page-fee-table tr[data-manuscript="${CSS.escape(item.稿件编号)}"]`);
+    if (!row) {
+        return;
+    }
+    row.innerHTML = pageFeeRowCells(item);
+    row.querySelectorAll('.status-checkbox').forEach(checkbox => {
+        checkbox.addEventListener('change', handleStatusChange);
+    });
 }
 
 async function handleStatusChange(event) {
@@ -529,7 +572,7 @@ async function handleScraping(event) {
     const year = yearInput.value;
     const issue = issueInput.value;
 
-    resultDiv.innerHTML = '<p class="info">正在爬取数据,请稍候...</p>';
+    resultDiv.innerHTML = '<p class="info">正在提交爬虫任务...</p>';
 
     try {
         const response = await fetch('/start_scraping', {
@@ -545,13 +588,58 @@ async function handleScraping(event) {
         }
 
         const data = await response.json();
-        displayScrapingResult(data, resultDiv);
+        watchScrapingJob(data.job_id, resultDiv);
     } catch (error) {
         console.error('爬虫任务失败:', error);
         resultDiv.innerHTML = `<p class="error">爬虫任务失败: ${error.message}</p>`;
     }
 }
 
+// 订阅后台爬虫任务的进度，任务结束后显示结果
+function watchScrapingJob(jobId, resultDiv) {
+    const source = new EventSource(`/jobs/${jobId}/events`);
+    source.addEventListener('progress', event => {
+        const job = JSON.parse(event.data);
+        if (job.status === 'completed' || job.status === 'cancelled') {
+            source.close();
+            if (job.result) {
+                displayScrapingResult(job.result, resultDiv);
+            }
+            if (job.status === 'cancelled') {
+                resultDiv.insertAdjacentHTML('afterbegin', '<p class="info">任务已取消</p>');
+            }
+            return;
+        }
+        if (job.status === 'failed') {
+            source.close();
+            resultDiv.innerHTML = `<p class="error">爬虫任务失败: ${job.error}</p>`;
+            return;
+        }
+        displayScrapingProgress(job, resultDiv);
+    });
+    source.onerror = () => {
+        // 连接断开时浏览器会自动重连，任务仍在后台运行
+        console.warn('任务进度连接中断，正在重连');
+    };
+}
+
+function displayScrapingProgress(job, resultDiv) {
+    const { found, fetched, downloaded, rendered, failed } = job.progress;
+    const statusText = job.status === 'queued' ? '排队中' : (job.cancel_requested ? '正在取消' : '正在爬取');
+    resultDiv.innerHTML = `
+        <p class="info">${statusText}：${job.year} 年 ${job.issue}</p>
+        <p>已发现 ${found} 篇，已获取 ${fetched} 篇，已下载 ${downloaded} 篇，已转换 ${rendered} 篇，失败 ${failed} 篇</p>
+        <button type="button" id="cancel-scraping" ${job.cancel_requested ? 'disabled' : ''}>取消任务</button>
+    `;
+    document.getElementById('cancel-scraping').addEventListener('click', async () => {
+        const response = await fetch(`/jobs/${job.job_id}/cancel`, { method: 'POST' });
+        if (!response.ok) {
+            const data = await response.json();
+            alert('取消失败: ' + data.error);
+        }
+    });
+}
+
 function displayScrapingResult(data, resultDiv) {
     const { year, issue, articles_count, processed_articles } = data;
     